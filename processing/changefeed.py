@@ -0,0 +1,139 @@
+"""
+Change Feed
+===========
+Emits a compact delta between the previous run's output and the current one,
+so downstream consumers can apply inserts/updates/deletes instead of
+reloading whole files. Each dataset keeps a Parquet snapshot of its last
+published state; a keyed hash join against it yields the delta, and
+manifest.json records every version.
+"""
+
+import polars as pl
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+from files import file_lock, write_atomic
+
+FEED_DIR = Path(__file__).resolve().parent.parent / "processed-data" / "changes"
+MANIFEST = "manifest.json"
+
+
+def compute_delta(previous, current, keys):
+    """
+    Full hash join of two snapshots on `keys`. Returns one row per changed key
+    with an `op` column (insert/update/delete) and <col>_old / <col>_new values.
+    Columns added or dropped between the snapshots are null on the side that
+    lacks them.
+    """
+    values = [c for c in current.columns if c not in keys]
+    values += [c for c in previous.columns if c not in keys and c not in values]
+
+    def aligned(frame, other):
+        missing = [pl.lit(None, dtype=other.schema[c]).alias(c) for c in values if c not in frame.columns]
+        return frame.with_columns(missing).select([*keys, *values])
+
+    joined = (
+        aligned(previous, current).with_columns(pl.lit(True).alias("_in_old"))
+        .join(
+            aligned(current, previous).with_columns(pl.lit(True).alias("_in_new")),
+            on=keys,
+            how="full",
+            coalesce=True,
+            suffix="_new",
+        )
+        .rename({c: f"{c}_old" for c in values})
+    )
+    changed = pl.any_horizontal([pl.col(f"{c}_old").ne_missing(pl.col(f"{c}_new")) for c in values])
+    op = (
+        pl.when(pl.col("_in_old").is_null()).then(pl.lit("insert"))
+        .when(pl.col("_in_new").is_null()).then(pl.lit("delete"))
+        .when(changed).then(pl.lit("update"))
+        .otherwise(None)
+    )
+    return (
+        joined.with_columns(op.cast(pl.Enum(["insert", "update", "delete"])).alias("op"))
+        .filter(pl.col("op").is_not_null())
+        .select(["op", *keys, *[f"{c}_{side}" for c in values for side in ("old", "new")]])
+        .sort([*keys])
+    )
+
+
+def align_dtypes(previous, current):
+    """
+    Casts the previous snapshot's columns to their current dtypes so dtype-only
+    changes are not reported as updates. A column whose values cannot be cast
+    is compared as strings on both sides. Returns (previous, current, changes),
+    where changes maps each retyped column to "old -> new".
+    """
+    changes = {}
+    for c in previous.columns:
+        old, new = previous.schema[c], current.schema.get(c)
+        if new is None or old == new:
+            continue
+        changes[c] = f"{old} -> {new}"
+        try:
+            previous = previous.with_columns(pl.col(c).cast(new))
+        except (pl.exceptions.InvalidOperationError, pl.exceptions.ComputeError):
+            previous = previous.with_columns(pl.col(c).cast(pl.Utf8))
+            current = current.with_columns(pl.col(c).cast(pl.Utf8))
+    return previous, current, changes
+
+
+def _load_manifest(feed_dir):
+    path = feed_dir / MANIFEST
+    if not path.exists():
+        return {"datasets": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def publish_changes(current, name, keys, feed_dir=FEED_DIR):
+    """
+    Diffs `current` (polars or pandas) against the last snapshot of dataset `name`,
+    writes the delta and the new snapshot, and bumps the dataset's version in
+    the manifest. Returns the delta.
+    """
+    if not isinstance(current, (pl.DataFrame, pl.LazyFrame)):
+        current = pl.from_pandas(current)
+    current = current.lazy().collect()
+    feed_dir = Path(feed_dir)
+    feed_dir.mkdir(parents=True, exist_ok=True)
+
+    # Serializes feed updates across stages so versions are never lost or reused
+    with file_lock(feed_dir / f".{MANIFEST}.lock"):
+        manifest = _load_manifest(feed_dir)
+        entry = manifest["datasets"].get(name, {"version": 0, "keys": keys, "history": []})
+        snapshot_path = feed_dir / f"{name}.snapshot.parquet"
+        previous = pl.read_parquet(snapshot_path) if snapshot_path.exists() else current.clear()
+        previous, compared, schema_changes = align_dtypes(previous, current)
+        if schema_changes:
+            print(f"⚠️ Change feed {name}: column types changed ({', '.join(f'{c}: {t}' for c, t in schema_changes.items())})")
+
+        delta = compute_delta(previous, compared, keys)
+        version = entry["version"] + 1
+        delta_path = feed_dir / f"{name}.v{version:06d}.delta.parquet"
+        write_atomic(delta_path, delta.write_parquet)
+        write_atomic(snapshot_path, current.write_parquet)
+
+        counts = delta["op"].value_counts()
+        counts = dict(zip(counts["op"].cast(pl.Utf8).to_list(), counts["count"].to_list()))
+        entry.update({"version": version, "keys": keys, "snapshot": snapshot_path.name})
+        entry["history"].append({
+            "version": version,
+            "previous_version": version - 1,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "delta": delta_path.name,
+            "rows": current.shape[0],
+            "inserted": counts.get("insert", 0),
+            "updated": counts.get("update", 0),
+            "deleted": counts.get("delete", 0),
+            **({"schema_changes": schema_changes} if schema_changes else {}),
+        })
+        manifest["datasets"][name] = entry
+        write_atomic(feed_dir / MANIFEST, lambda p: p.write_text(json.dumps(manifest, indent=2)))
+
+    print(
+        f"✅ Change feed {name} v{version}: "
+        f"+{counts.get('insert', 0):,} ~{counts.get('update', 0):,} -{counts.get('delete', 0):,} → {delta_path}"
+    )
+    return delta
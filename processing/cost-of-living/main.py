@@ -1,9 +1,19 @@
 import requests
 import pandas as pd
+import polars as pl
 import os
+import sys
 from io import StringIO
+from pathlib import Path
 
-FRED_CSV_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv?id={series_id}"
+# The shared schema registry lives one level up in processing/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from schemas import apply_schema, split_rejected, report_rejected
+from changefeed import publish_changes
+from handoff import publish
+from upstream import upstream_url
+
+FRED_CSV_URL = upstream_url("https://fred.stlouisfed.org/graph/fredgraph.csv?id={series_id}")
 
 def fetch_fred_series(series_id: str):
     """Fetch a FRED time series as a DataFrame(year, value)."""
@@ -18,7 +28,8 @@ def fetch_fred_series(series_id: str):
     if text.startswith("<") or "DOCTYPE html" in text:
         raise ValueError(f"❌ FRED returned HTML for {series_id} (likely invalid ID or redirect)")
 
-    df = pd.read_csv(StringIO(text))
+    # Read every column as a string; the schema registry types date and value below
+    df = pd.read_csv(StringIO(text), dtype=str, keep_default_na=False)
     if df.empty:
         raise ValueError(f"❌ Empty CSV for {series_id}")
 
@@ -38,10 +49,17 @@ def fetch_fred_series(series_id: str):
     # Identify the value column (the other one)
     value_col = [c for c in df.columns if c != date_col][0]
 
-    # Parse year and rename columns
-    df["year"] = pd.to_datetime(df[date_col]).dt.year
-    df = df.rename(columns={value_col: "value"})[["year", "value"]]
-    df = df.dropna(subset=["value"])
+    # Parse year and rename columns (FRED marks missing observations with ".")
+    df = pl.from_pandas(df.rename(columns={date_col: "date", value_col: "value"})[["date", "value"]])
+    df = df.with_columns(pl.col("value").replace(".", None))
+    df, rejected = split_rejected(apply_schema(df, "fred"))
+    report_rejected(f"fred {series_id}", rejected)
+    df = (
+        df.with_columns(pl.col("date").dt.year().alias("year"))
+        .select(["year", "value"])
+        .drop_nulls("value")
+        .to_pandas()
+    )
     print(f"✅ Loaded {len(df)} rows for {series_id}")
     return df
 
@@ -76,9 +94,11 @@ def main():
         output_dir = "../../processed-data/cost-of-living"
         os.makedirs(output_dir, exist_ok=True)
         
+        publish("us_consumer_spending", combined)
         output_path = os.path.join(output_dir, "us_consumer_spending.csv")
         combined.to_csv(output_path, index=False)
         print(f"✅ Saved {output_path}")
+        publish_changes(combined, "us_consumer_spending", ["year"])
         print(combined.head(10))
     else:
         print("❌ No valid data saved")
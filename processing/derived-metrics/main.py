@@ -0,0 +1,69 @@
+import polars as pl
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Shared modules live one level up in processing/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from handoff import load, publish
+from metrics import housing_metrics, income_metrics, state_income_metrics, spending_metrics
+from sampling import sample_fraction, sampled_name, sampled_path
+
+PROCESSED_DIR = "../../processed-data"
+
+INPUTS = {
+    "housing_prices_city_aggregated": "housing-data/housing_prices_city_aggregated.csv",
+    "acs1y_s1901_median_income": "median-salary/acs1y_s1901_median_income_2010_2023.csv",
+    "us_consumer_spending": "cost-of-living/us_consumer_spending.csv",
+}
+
+# Each metrics table is stored next to the table it is derived from
+OUTPUTS = {
+    "housing_metrics_city_year": "housing-data/housing_metrics_city_year.csv",
+    "median_income_metrics_city_year": "median-salary/median_income_metrics_city_year.csv",
+    "median_income_metrics_state_year": "median-salary/median_income_metrics_state_year.csv",
+    "us_consumer_spending_metrics": "cost-of-living/us_consumer_spending_metrics.csv",
+}
+
+
+def load_input(name, sample=None):
+    """Reads a processed dataset from the Arrow handoff, falling back to its CSV export."""
+    try:
+        return load(sampled_name(name, sample))
+    except FileNotFoundError:
+        path = sampled_path(os.path.join(PROCESSED_DIR, INPUTS[name]), sample)
+        print(f"⚠️ No Arrow handoff for {sampled_name(name, sample)}; reading {path}")
+        return pl.read_csv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute growth, ratio and rank metrics from the processed datasets.")
+    parser.add_argument("--sample", type=sample_fraction, default=None, metavar="FRACTION",
+                        help="Use the outputs of a sampled preview run (same fraction as the earlier stages)")
+    args = parser.parse_args()
+    if args.sample:
+        print(f"🧪 Sampled preview run ({args.sample * 100:g}% of places): outputs are not the full dataset")
+
+    housing = load_input("housing_prices_city_aggregated", args.sample)
+    income = load_input("acs1y_s1901_median_income", args.sample)
+    # The national spending series is tiny and never sampled
+    spending = load_input("us_consumer_spending")
+
+    print("📐 Computing derived metrics...")
+    tables = {
+        "housing_metrics_city_year": housing_metrics(housing, income, spending),
+        "median_income_metrics_city_year": income_metrics(income, spending),
+        "median_income_metrics_state_year": state_income_metrics(income, spending),
+        "us_consumer_spending_metrics": spending_metrics(spending),
+    }
+
+    for name, table in tables.items():
+        publish(sampled_name(name, args.sample), table)
+        output_path = sampled_path(os.path.join(PROCESSED_DIR, OUTPUTS[name]), args.sample)
+        table.write_csv(output_path)
+        print(f"✅ Saved {output_path} ({table.shape[0]:,} rows, {table.shape[1]} columns)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Shared File Helpers
+===================
+Atomic writes and inter-process locks for every file that another stage or
+a concurrent run may read while it is being written (Arrow handoff, change
+feed, processor cache, shard partials, spatial index).
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to unlocked access
+    fcntl = None
+
+
+def write_atomic(path, write):
+    """
+    Calls `write(tmp_path)` next to `path`, then renames the result onto `path`,
+    so readers see either the old file or the complete new one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock on `path` (held for the duration of the block)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as handle:
+        if fcntl:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_UN)
@@ -0,0 +1,57 @@
+"""
+Arrow Handoff
+=============
+Passes datasets between pipeline stages as Arrow data instead of CSV text.
+Within one process `publish` keeps the frame in memory and `load` returns it
+as-is; across processes `load` memory-maps the uncompressed Arrow IPC file
+that `publish` wrote, so no stage pays for formatting, parsing or type
+inference. CSV stays an export format only.
+"""
+
+import polars as pl
+import pyarrow as pa
+from pathlib import Path
+from files import write_atomic
+
+ARROW_DIR = Path(__file__).resolve().parent.parent / "processed-data" / "arrow"
+
+# Frames published by this process, by dataset name
+_published = {}
+
+
+def arrow_path(name, arrow_dir=ARROW_DIR):
+    return Path(arrow_dir) / f"{name}.arrow"
+
+
+def publish(name, frame, arrow_dir=ARROW_DIR):
+    """Makes `frame` (polars or pandas) available to later stages and writes its IPC file."""
+    if not isinstance(frame, pl.DataFrame):
+        frame = pl.from_pandas(frame)
+    # Uncompressed so readers can memory-map it without decoding
+    path = write_atomic(arrow_path(name, arrow_dir), lambda p: frame.write_ipc(p, compression="uncompressed"))
+    _published[name] = frame
+    print(f"✅ Published {name} ({frame.shape[0]:,} rows) → {path}")
+    return frame
+
+
+def published_at(name, arrow_dir=ARROW_DIR):
+    """Modification time of a published dataset's IPC file, or None if it has not been published."""
+    path = arrow_path(name, arrow_dir)
+    return path.stat().st_mtime if path.exists() else None
+
+
+def load(name, arrow_dir=ARROW_DIR):
+    """Returns a published dataset: in-memory if this process published it, else memory-mapped."""
+    if name in _published:
+        return _published[name]
+    path = arrow_path(name, arrow_dir)
+    if not path.exists():
+        raise FileNotFoundError(f"❌ {name} has not been published (no {path})")
+    # The map stays open for as long as the returned buffers reference it
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    return pl.from_arrow(table, rechunk=False)
+
+
+def load_pandas(name, arrow_dir=ARROW_DIR):
+    """Published dataset as an Arrow-backed pandas DataFrame (no copy of the column buffers)."""
+    return load(name, arrow_dir).to_pandas(use_pyarrow_extension_array=True)
@@ -1,47 +1,20 @@
 import polars as pl
 from redfin import RedfinProcessor
 from zillow import ZillowProcessor
+from sharding import run_sharded, run_shard, merge_shards, merge_zip_prices
+from spatial import area_prices
+from sampling import sample_fraction, sampled_name, sampled_path
+from sketches import merge_sketches, sketch_quantiles
+from changefeed import publish_changes
+from cache import ProcessorCache
+from handoff import publish
+from states import STATE_MAP
+from upstream import UPSTREAM_ENV
+import argparse
 import os
-STATE_MAP = {
-    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
-    "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE", "Florida": "FL", "Georgia": "GA",
-    "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA",
-    "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
-    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS", "Missouri": "MO",
-    "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH", "New Jersey": "NJ",
-    "New Mexico": "NM", "New York": "NY", "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH",
-    "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI",
-    "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX",
-    "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
-    "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY"
-}
 
 
-print("Running Redfin Processor...")
-redfin_df = RedfinProcessor().create_data()
-
-print("Running Zillow Processor...")
-zillow_df = ZillowProcessor().create_data()
-
-# Inspect Zillow data before normalization
-print("\n🔍 Inspecting Zillow raw data (before cleaning)...")
-print(zillow_df.head(10))
-
-# Find rows with missing City/State/YEAR but non-null avg_price
-bad_rows = zillow_df.filter(
-    (pl.col("City").is_null() | (pl.col("City") == "")) &
-    (pl.col("State").is_null() | (pl.col("State") == "")) &
-    pl.col("avg_price").is_not_null()
-)
-print(f"\n⚠️ Found {bad_rows.shape[0]} rows with empty City/State but avg_price present.")
-print(bad_rows.head(20))
-
-
-# === Normalize column names ===
-redfin_df = redfin_df.rename({"CITY": "City", "STATE": "State"})
-
-
-def normalize(df: pl.DataFrame, is_redfin: bool = False) -> pl.DataFrame:
+def normalize_keys(df: pl.DataFrame, is_redfin: bool = False) -> pl.DataFrame:
     # Map full state names to abbreviations (for Redfin)
     state_expr = (
         pl.col("State")
@@ -60,8 +33,6 @@ def normalize(df: pl.DataFrame, is_redfin: bool = False) -> pl.DataFrame:
               .alias("City"),
             state_expr.alias("State"),
             pl.col("YEAR").cast(pl.Int32),
-            pl.col("avg_price").cast(pl.Float64),
-            pl.col("zip_count").cast(pl.Int32),
         ])
         .filter(
             pl.col("City").is_not_null() & (pl.col("City") != "") &
@@ -71,101 +42,284 @@ def normalize(df: pl.DataFrame, is_redfin: bool = False) -> pl.DataFrame:
     )
 
 
-redfin_df = normalize(redfin_df, is_redfin=True)
-zillow_df = normalize(zillow_df, is_redfin=False)
+def normalize(df: pl.DataFrame, is_redfin: bool = False) -> pl.DataFrame:
+    return normalize_keys(df, is_redfin).with_columns([
+        pl.col("avg_price").cast(pl.Float64),
+        pl.col("zip_count").cast(pl.Int32),
+    ])
 
-print(f"✅ Redfin: {redfin_df.shape[0]:,} rows")
-print(f"✅ Zillow: {zillow_df.shape[0]:,} rows")
 
-print("\n🔍 Checking for blanks BEFORE join...")
-for name, df in [("Redfin", redfin_df), ("Zillow", zillow_df)]:
-    if df is not None:
-        blanks = df.filter(
-            (pl.col("City").is_null() | (pl.col("City") == "")) |
-            (pl.col("State").is_null() | (pl.col("State") == "")) |
-            (pl.col("YEAR").is_null())
-        )
-        print(f"⚠️ {name} blank rows: {blanks.shape[0]:,}")
-
-
-# === Full outer join ===
-print("Joining datasets on City, State, YEAR (full join)...")
-merged = redfin_df.join(
-    zillow_df,
-    on=["City", "State", "YEAR"],
-    how="full",
-    suffix="_zillow",
-)
-
-print(f"✅ After join: {merged.shape[0]:,} rows")
-
-# === Coalesce columns so nulls are filled from Zillow side ===
-merged = merged.with_columns([
-    pl.coalesce([pl.col("City"), pl.col("City_zillow")]).alias("City"),
-    pl.coalesce([pl.col("State"), pl.col("State_zillow")]).alias("State"),
-    pl.coalesce([pl.col("YEAR"), pl.col("YEAR_zillow")]).alias("YEAR"),
-])
-
-# === Drop duplicate columns now that coalesce filled them ===
-merged = merged.drop(["City_zillow", "State_zillow", "YEAR_zillow"])
-
-# === Check for blanks again ===
-missing = merged.filter(
-    (pl.col("City").is_null() | (pl.col("City") == "")) |
-    (pl.col("State").is_null() | (pl.col("State") == "")) |
-    (pl.col("YEAR").is_null())
-)
-
-print(f"⚠️ Empty City/State/YEAR rows after coalesce: {missing.shape[0]:,}")
-if missing.shape[0] > 0:
-    print(missing.head(10))
-
-
-
-print(f"✅ After join: {merged.shape[0]:,} rows")
-
-
-# === Resolve overlap ===
-result = (
-    merged
-    .with_columns([
-        # Pick final price based on zip_count
-        pl.when(pl.col("avg_price").is_not_null() & pl.col("avg_price_zillow").is_not_null())
-          .then(
-              pl.when(pl.col("zip_count") > pl.col("zip_count_zillow"))
-               .then(pl.col("avg_price"))
-               .when(pl.col("zip_count") < pl.col("zip_count_zillow"))
-               .then(pl.col("avg_price_zillow"))
-               .otherwise((pl.col("avg_price") + pl.col("avg_price_zillow")) / 2)
-          )
-          .otherwise(pl.coalesce([pl.col("avg_price"), pl.col("avg_price_zillow")]))
-          .alias("avg_price_final"),
-
-        # Highest zip_count between both
-        pl.when(pl.col("zip_count").is_not_null() & pl.col("zip_count_zillow").is_not_null())
-          .then(pl.max_horizontal("zip_count", "zip_count_zillow"))
-          .otherwise(pl.coalesce([pl.col("zip_count"), pl.col("zip_count_zillow")]))
-          .alias("zip_count_final"),
+def save_sketches(redfin, zillow, sample=None):
+    """Merges both sources' per-city-year sketches and saves them with p25/p50/p90 prices."""
+    keys = ["City", "State", "YEAR"]
+    sketches = merge_sketches([
+        normalize_keys(redfin.sketches.rename({"CITY": "City", "STATE": "State"}), is_redfin=True),
+        normalize_keys(zillow.sketches, is_redfin=False),
+    ], keys).sort([*keys, "bucket"]).collect()
+
+    sketch_path = sampled_path("../../processed-data/housing-data/housing_price_sketches_city_year.parquet", sample)
+    sketches.write_parquet(sketch_path)
+    print(f"✅ Saved {sketches.shape[0]:,} sketch buckets to {sketch_path}")
+
+    quantiles = sketch_quantiles(sketches, keys).collect()
+    quantile_path = sampled_path("../../processed-data/housing-data/housing_price_quantiles_city_year.csv", sample)
+    publish(sampled_name("housing_price_quantiles_city_year", sample), quantiles)
+    quantiles.write_csv(quantile_path)
+    print(f"✅ Saved city-year price quantiles to {quantile_path}")
+    publish_changes(quantiles, sampled_name("housing_price_quantiles_city_year", sample), ["State", "City", "YEAR"])
+
+
+def save_area_prices(redfin, zillow, args):
+    """Average ZIP-level prices (both sources) within a radius of, or the k ZIPs nearest, each query point."""
+    queries = pl.read_csv(args.area_queries)
+    index = redfin.zip_index(args.zip_index)
+    redfin.cleanup()
+    zip_prices = merge_zip_prices([redfin.zip_prices, zillow.zip_prices]).collect()
+
+    lat, lng = queries["lat"].to_numpy(), queries["lng"].to_numpy()
+    if args.nearest:
+        print(f"📍 Averaging the {args.nearest} nearest ZIPs around {queries.shape[0]:,} point(s)...")
+        matches = index.nearest(lat, lng, args.nearest)
+    else:
+        print(f"📍 Averaging ZIPs within {args.radius_miles:g} miles of {queries.shape[0]:,} point(s)...")
+        matches = index.radius(lat, lng, args.radius_miles)
+    result = area_prices(matches, queries, zip_prices)
+    empty = result.filter(pl.col("zip_count") == 0)
+    if empty.shape[0]:
+        print(f"⚠️ {empty.shape[0]:,} point(s) have no priced ZIP in range (kept with empty prices): "
+              f"{', '.join(str(v) for v in empty[queries.columns[0]].to_list())}")
+
+    output_path = sampled_path("../../processed-data/housing-data/housing_prices_area_year.csv", args.sample)
+    result.write_csv(output_path)
+    print(f"✅ Saved {result.shape[0]:,} area-year rows to {output_path}")
+    return result
+
+
+def create_source(processor, args):
+    """Runs a processor single-node, or as one/all shards of a sharded run."""
+    if args.shards <= 1:
+        return processor.create_data()
+    if args.merge_only:
+        return processor.memoize(lambda: merge_shards(processor, args.shards, args.shard_dir))
+    if args.shard_index is not None:
+        # Multi-host mode: this host only emits its own partial aggregate
+        try:
+            processor.grab_data()
+            run_shard(processor, args.shard_index, args.shards, args.shard_by, args.shard_dir)
+        finally:
+            processor.cleanup()
+        return None
+    return processor.memoize(
+        lambda: run_sharded(processor, args.shards, args.shard_dir, args.shard_by, args.workers)
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the city-level housing price dataset.")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Split ZIP-level sources into this many partial aggregates")
+    parser.add_argument("--shard-by", choices=["zip", "state"], default="zip",
+                        help="Partition key used to assign rows to shards")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for a local sharded run (default: one per core)")
+    parser.add_argument("--shard-dir", default="shards",
+                        help="Directory (local or shared between hosts) holding shard partials")
+    parser.add_argument("--shard-index", type=int, default=None,
+                        help="Only compute this shard and write its partial (multi-host mode)")
+    parser.add_argument("--merge-only", action="store_true",
+                        help="Merge partials already present in --shard-dir instead of computing them")
+    parser.add_argument("--sketches", action="store_true",
+                        help="Also build mergeable per-city-year price quantile sketches")
+    parser.add_argument("--cache-dir", default="processor_cache",
+                        help="Directory for memoized processor results")
+    parser.add_argument("--cache-ttl-days", type=float, default=30,
+                        help="Discard cached results older than this")
+    parser.add_argument("--cache-max-gb", type=float, default=2,
+                        help="Evict least-recently-used cached results beyond this size")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always recompute processor results")
+    parser.add_argument("--offline", action="store_true",
+                        help="If sources cannot be reached, reuse the newest cached result built from them "
+                             "(may be stale)")
+    parser.add_argument("--area-queries", default=None,
+                        help="CSV of points (first column a name, plus lat, lng) to aggregate ZIP prices around")
+    parser.add_argument("--radius-miles", type=float, default=30,
+                        help="Radius for --area-queries")
+    parser.add_argument("--nearest", type=int, default=None,
+                        help="Use the k nearest ZIPs per point instead of a radius")
+    parser.add_argument("--zip-index", default="spatial/zip_centroid_index.npz",
+                        help="Persisted ZIP centroid index (built from SimpleMaps on first use)")
+    parser.add_argument("--sample", type=sample_fraction, default=None, metavar="FRACTION",
+                        help="Preview run on a deterministic, per-state sample of cities (e.g. 0.01 or 1%%); "
+                             "outputs are written under *_sample_<pct> names")
+    parser.add_argument("--upstream-base-url", default=None,
+                        help=f"Fetch every source from this host instead (e.g. the local stand-in "
+                             f"server); same as setting ${UPSTREAM_ENV}")
+    return parser.parse_args(argv)
+
+
+def build(args):
+    """
+    Runs both processors and merges them. Returns the city-level frame, which is
+    also published for later stages (in memory and as Arrow IPC); None when
+    this run only emitted a shard.
+    """
+    if args.upstream_base_url:
+        # Through the environment so spawned shard workers resolve the same URLs
+        os.environ[UPSTREAM_ENV] = args.upstream_base_url
+
+    cache = None if args.no_cache else ProcessorCache(
+        args.cache_dir, ttl_days=args.cache_ttl_days, max_bytes=int(args.cache_max_gb * 1024 ** 3),
+        offline=args.offline,
+    )
+    with_zip_prices = args.area_queries is not None
+    options = dict(with_sketches=args.sketches, cache=cache, with_zip_prices=with_zip_prices, sample=args.sample)
+    redfin = RedfinProcessor(**options)
+    zillow = ZillowProcessor(**options)
+    if args.sample:
+        print(f"🧪 Sampled preview run ({args.sample * 100:g}% of places): outputs are not the full dataset")
+
+    print("Running Redfin Processor...")
+    redfin_df = create_source(redfin, args)
+
+    print("Running Zillow Processor...")
+    zillow_df = create_source(zillow, args)
+
+    if redfin_df is None or zillow_df is None:
+        print(f"✅ Wrote shard {args.shard_index} partials to {args.shard_dir}; run with --merge-only once all shards exist.")
+        return None
+
+    # Inspect Zillow data before normalization
+    print("\n🔍 Inspecting Zillow raw data (before cleaning)...")
+    print(zillow_df.head(10))
+
+    # Find rows with missing City/State/YEAR but non-null avg_price
+    bad_rows = zillow_df.filter(
+        (pl.col("City").is_null() | (pl.col("City") == "")) &
+        (pl.col("State").is_null() | (pl.col("State") == "")) &
+        pl.col("avg_price").is_not_null()
+    )
+    print(f"\n⚠️ Found {bad_rows.shape[0]} rows with empty City/State but avg_price present.")
+    print(bad_rows.head(20))
+
+
+    # === Normalize column names ===
+    redfin_df = redfin_df.rename({"CITY": "City", "STATE": "State"})
+
+
+    redfin_df = normalize(redfin_df, is_redfin=True)
+    zillow_df = normalize(zillow_df, is_redfin=False)
+
+    print(f"✅ Redfin: {redfin_df.shape[0]:,} rows")
+    print(f"✅ Zillow: {zillow_df.shape[0]:,} rows")
+
+    print("\n🔍 Checking for blanks BEFORE join...")
+    for name, df in [("Redfin", redfin_df), ("Zillow", zillow_df)]:
+        if df is not None:
+            blanks = df.filter(
+                (pl.col("City").is_null() | (pl.col("City") == "")) |
+                (pl.col("State").is_null() | (pl.col("State") == "")) |
+                (pl.col("YEAR").is_null())
+            )
+            print(f"⚠️ {name} blank rows: {blanks.shape[0]:,}")
+
+
+    # === Full outer join ===
+    print("Joining datasets on City, State, YEAR (full join)...")
+    merged = redfin_df.join(
+        zillow_df,
+        on=["City", "State", "YEAR"],
+        how="full",
+        suffix="_zillow",
+    )
+
+    print(f"✅ After join: {merged.shape[0]:,} rows")
+
+    # === Coalesce columns so nulls are filled from Zillow side ===
+    merged = merged.with_columns([
+        pl.coalesce([pl.col("City"), pl.col("City_zillow")]).alias("City"),
+        pl.coalesce([pl.col("State"), pl.col("State_zillow")]).alias("State"),
+        pl.coalesce([pl.col("YEAR"), pl.col("YEAR_zillow")]).alias("YEAR"),
     ])
-    .select(["City", "State", "YEAR", "avg_price_final", "zip_count_final"])
-    .rename({"avg_price_final": "avg_price", "zip_count_final": "zip_count"})
-    .sort(["State", "City", "YEAR"])
-)
-
-# === Save ===
-# Create processed-data directory if it doesn't exist
-os.makedirs("../../processed-data/housing-data", exist_ok=True)
-
-output_path = "../../processed-data/housing-data/housing_prices_city_aggregated.csv"
-result = result.unique(["City", "State", "YEAR"])
-
-result.write_csv(output_path)
-print(f"✅ Saved combined dataset to {output_path}")
-print(f"✅ Final row count: {result.shape[0]:,}")
-print(result.head(10))
-
-# Quick diagnostics
-print("Unique City-State-Year combos:")
-print(f"Redfin: {redfin_df.select(pl.count()).item()} rows")
-print(f"Zillow: {zillow_df.select(pl.count()).item()} rows")
-print(f"Merged: {merged.select(pl.count()).item()} rows")
+
+    # === Drop duplicate columns now that coalesce filled them ===
+    merged = merged.drop(["City_zillow", "State_zillow", "YEAR_zillow"])
+
+    # === Check for blanks again ===
+    missing = merged.filter(
+        (pl.col("City").is_null() | (pl.col("City") == "")) |
+        (pl.col("State").is_null() | (pl.col("State") == "")) |
+        (pl.col("YEAR").is_null())
+    )
+
+    print(f"⚠️ Empty City/State/YEAR rows after coalesce: {missing.shape[0]:,}")
+    if missing.shape[0] > 0:
+        print(missing.head(10))
+
+
+
+    print(f"✅ After join: {merged.shape[0]:,} rows")
+
+
+    # === Resolve overlap ===
+    result = (
+        merged
+        .with_columns([
+            # Pick final price based on zip_count
+            pl.when(pl.col("avg_price").is_not_null() & pl.col("avg_price_zillow").is_not_null())
+              .then(
+                  pl.when(pl.col("zip_count") > pl.col("zip_count_zillow"))
+                   .then(pl.col("avg_price"))
+                   .when(pl.col("zip_count") < pl.col("zip_count_zillow"))
+                   .then(pl.col("avg_price_zillow"))
+                   .otherwise((pl.col("avg_price") + pl.col("avg_price_zillow")) / 2)
+              )
+              .otherwise(pl.coalesce([pl.col("avg_price"), pl.col("avg_price_zillow")]))
+              .alias("avg_price_final"),
+
+            # Highest zip_count between both
+            pl.when(pl.col("zip_count").is_not_null() & pl.col("zip_count_zillow").is_not_null())
+              .then(pl.max_horizontal("zip_count", "zip_count_zillow"))
+              .otherwise(pl.coalesce([pl.col("zip_count"), pl.col("zip_count_zillow")]))
+              .alias("zip_count_final"),
+        ])
+        .select(["City", "State", "YEAR", "avg_price_final", "zip_count_final"])
+        .rename({"avg_price_final": "avg_price", "zip_count_final": "zip_count"})
+        .sort(["State", "City", "YEAR"])
+    )
+
+    # === Save ===
+    # Create processed-data directory if it doesn't exist
+    os.makedirs("../../processed-data/housing-data", exist_ok=True)
+
+    output_path = sampled_path("../../processed-data/housing-data/housing_prices_city_aggregated.csv", args.sample)
+    result = result.unique(["City", "State", "YEAR"])
+
+    publish(sampled_name("housing_prices_city_aggregated", args.sample), result)
+    # CSV is kept as the export format; later stages read the Arrow handoff
+    result.write_csv(output_path)
+    print(f"✅ Saved combined dataset to {output_path}")
+    print(f"✅ Final row count: {result.shape[0]:,}")
+    publish_changes(result, sampled_name("housing_prices_city_aggregated", args.sample), ["State", "City", "YEAR"])
+    print(result.head(10))
+
+    if args.sketches:
+        save_sketches(redfin, zillow, args.sample)
+
+    if args.area_queries:
+        save_area_prices(redfin, zillow, args)
+
+    # Quick diagnostics
+    print("Unique City-State-Year combos:")
+    print(f"Redfin: {redfin_df.select(pl.len()).item()} rows")
+    print(f"Zillow: {zillow_df.select(pl.len()).item()} rows")
+    print(f"Merged: {merged.select(pl.len()).item()} rows")
+    return result
+
+
+def main():
+    build(parse_args())
+
+
+if __name__ == "__main__":
+    main()
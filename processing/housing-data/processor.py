@@ -1,16 +1,157 @@
+import polars as pl
+from pathlib import Path
+import hashlib
+import inspect
+import json
+import sys
+
+# The shared schema registry lives one level up in processing/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from schemas import REJECTED, report_rejected
+from sharding import partial_aggregate, finalize_partials, shard_filter, zip_price_partial
+from sketches import build_sketches
+from cache import ProcessorCache, source_fingerprint, code_version
+from upstream import upstream_url, SIMPLEMAPS_URL
+
+
 class Processor:
-    def __init__(self):
+    # Subclasses describe their ZIP-level rows so partial aggregation is shared
+    name = None
+    group_keys = []
+    value_col = None
+    zip_col = None
+    state_col = None
+
+    def __init__(self, with_sketches=False, cache=True, with_zip_prices=False, sample=None):
         self.data = None
         self.input_path = None
         self.output_path = None
+        self.with_sketches = with_sketches
+        self.sketches = None
+        self.with_zip_prices = with_zip_prices
+        self.zip_prices = None
+        # Fraction of places kept by a sampled preview run (None = everything)
+        self.sample = sample
+        self.rejected_rows = 0
+        # True → default ProcessorCache, False/None → no caching, or a ProcessorCache instance
+        self.cache = ProcessorCache() if cache is True else (cache or None)
+
+    def source_urls(self):
+        """Remote inputs whose metadata fingerprints the cached results."""
+        return []
+
+    def cache_params(self):
+        """Parameters that change the processor's output (part of the cache key)."""
+        params = {"with_sketches": self.with_sketches, "with_zip_prices": self.with_zip_prices, "sample": self.sample}
+        if self.sample:
+            # Samples are drawn from the SimpleMaps place list, whichever sources the processor reads
+            params["sample_places"] = upstream_url(SIMPLEMAPS_URL)
+        return params
+
+    def cache_key(self):
+        """Returns (key, scope): scope covers sources, parameters and code, key adds the source fingerprint."""
+        scope = hashlib.sha256(json.dumps([
+            self.name,
+            # The resolved URLs, so results fetched from another host (e.g. the stand-in server) never match
+            self.source_urls(),
+            self.cache_params(),
+            code_version(inspect.getfile(type(self))),
+        ], sort_keys=True).encode("utf-8")).hexdigest()[:24]
+        fingerprint = source_fingerprint(self.source_urls())
+        if fingerprint is None:
+            return f"offline-{self.name}-{scope}", scope
+        return f"{self.name}-{hashlib.sha256((scope + fingerprint).encode('utf-8')).hexdigest()[:24]}", scope
+
+    def memoize(self, compute):
+        """Returns cached results for this processor if present, otherwise runs `compute` and caches them."""
+        if self.cache is None:
+            return compute()
+
+        key, scope = self.cache_key()
+        with self.cache.computing(key):
+            frames = self.cache.get(key, scope)
+            if frames is not None:
+                print(f"⚡ Using cached {self.name} data ({key})")
+                self.data = frames["data"]
+                self.sketches = frames.get("sketches")
+                self.zip_prices = frames.get("zip_prices")
+                print(f"✅ Loaded cached {self.name} data ({self.data.shape[0]:,} rows).")
+                return self.data
+
+            print(f"🚀 No cached {self.name} data — generating it...")
+            compute()
+            if key.startswith("offline-"):
+                # Without a fingerprint the result cannot be versioned against its sources
+                print(f"⚠️ Not caching {self.name} data: its sources could not be fingerprinted")
+                return self.data
+            frames = {"data": self.data}
+            if self.sketches is not None:
+                frames["sketches"] = self.sketches
+            if self.zip_prices is not None:
+                frames["zip_prices"] = self.zip_prices
+            self.cache.put(key, scope, frames)
+            print(f"💾 Cached {self.name} data as {key}")
+        return self.data
 
     def grab_data(self):
         pass
 
-    def process(self):
+    def cleanup(self):
+        """Removes whatever grab_data downloaded."""
         pass
 
+    def zip_level(self):
+        """
+        Returns a LazyFrame of ZIP-level rows (group keys, ZIP and price) parsed
+        with the schema registry, including its REJECTED flag column.
+        """
+        raise NotImplementedError
+
+    def shard(self, shard_index=0, shard_count=1, shard_by="zip"):
+        """ZIP-level rows belonging to one shard."""
+        return shard_filter(
+            self.zip_level(), shard_index, shard_count, shard_by, self.zip_col, self.state_col
+        )
+
+    def partial(self, shard_index=0, shard_count=1, shard_by="zip"):
+        """Partial aggregate (sum, count, ZIP rows) for one shard of the ZIP-level rows."""
+        frame = self.shard(shard_index, shard_count, shard_by)
+        aggregate = partial_aggregate(
+            frame.filter(~pl.col(REJECTED)), self.group_keys, self.value_col, self.zip_col
+        )
+        # Both queries share one scan of the source
+        partial, rejected = pl.collect_all([aggregate, frame.select(pl.col(REJECTED).sum())])
+        self.rejected_rows = rejected.item()
+        report_rejected(self.name, self.rejected_rows)
+        return partial
+
+    def sketch(self, shard_index=0, shard_count=1, shard_by="zip"):
+        """Per-group quantile sketches for one shard of the ZIP-level rows."""
+        frame = self.shard(shard_index, shard_count, shard_by).filter(~pl.col(REJECTED))
+        return build_sketches(frame, self.group_keys, self.value_col).collect()
+
+    def zip_partial(self, shard_index=0, shard_count=1, shard_by="zip"):
+        """ZIP-year price sums and counts for one shard of the ZIP-level rows."""
+        frame = self.shard(shard_index, shard_count, shard_by).filter(~pl.col(REJECTED))
+        return zip_price_partial(frame, self.zip_col, self.value_col).collect()
+
+    def finalize(self, partial):
+        """Turns a (merged) partial aggregate into the city-level output."""
+        self.data = finalize_partials(partial, self.group_keys)
+        return self.data
+
+    def process(self):
+        if self.with_sketches:
+            self.sketches = self.sketch()
+        if self.with_zip_prices:
+            self.zip_prices = self.zip_partial()
+        return self.finalize(self.partial())
+
     def create_data(self):
-        self.grab_data()
-        self.process()
-        return self.data
\ No newline at end of file
+        def compute():
+            self.grab_data()
+            self.process()
+            return self.data
+
+        return self.memoize(compute)
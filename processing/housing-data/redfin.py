@@ -7,21 +7,36 @@ import urllib.request
 import shutil
 import os
 from processor import Processor
+from schemas import apply_schema, report_rejected, REJECTED
+from upstream import upstream_url, SIMPLEMAPS_URL
+from spatial import ZipIndex
+from sampling import sample_filter
 
 class RedfinProcessor(Processor):
-    def __init__(self, cache_path="redfin_cached_city_year.csv"):
-        super().__init__()
+    name = "redfin"
+    group_keys = ["CITY", "STATE", "YEAR"]
+    value_col = "MEDIAN_SALE_PRICE"
+    zip_col = "ZIP"
+    state_col = "STATE"
+
+    redfin_url = "https://redfin-public-data.s3.us-west-2.amazonaws.com/redfin_market_tracker/zip_code_market_tracker.tsv000.gz"
+    simplemaps_url = SIMPLEMAPS_URL
+
+    def __init__(self, with_sketches=False, cache=True, with_zip_prices=False, sample=None):
+        super().__init__(with_sketches, cache, with_zip_prices, sample)
         self.temp_dir = None
-        self.zipmap = None
-        self.redfin_df = None
-        self.cache_path = Path(cache_path)
+        self.redfin_tsv_path = None
+        self.zipmap_path = None
+
+    def source_urls(self):
+        return [upstream_url(self.redfin_url), upstream_url(self.simplemaps_url)]
 
     def grab_data(self):
-        """Downloads and loads both Redfin ZIP-level and SimpleMaps ZIP mapping data."""
+        """Downloads and extracts both Redfin ZIP-level and SimpleMaps ZIP mapping data."""
         self.temp_dir = Path(tempfile.mkdtemp())
+        redfin_url = self.source_urls()[0]
 
         # === 1. Download Redfin ZIP Market Tracker ===
-        redfin_url = "https://redfin-public-data.s3.us-west-2.amazonaws.com/redfin_market_tracker/zip_code_market_tracker.tsv000.gz"
         redfin_gz_path = self.temp_dir / "zip_code_market_tracker.tsv000.gz"
         redfin_tsv_path = self.temp_dir / "zip_code_market_tracker.tsv000"
 
@@ -45,36 +60,16 @@ class RedfinProcessor(Processor):
             shutil.copyfileobj(f_in, f_out)
         print(f"✅ Decompressed → {redfin_tsv_path}")
 
-        # === 2. Load Redfin data ===
-        print("📖 Reading Redfin TSV (lazy mode)...")
-        self.redfin_df = (
-            pl.scan_csv(
-                redfin_tsv_path,
-                separator="\t",
-                null_values=["", "NA", "NaN"],
-                ignore_errors=True,
-                infer_schema_length=10000,
-            )
-            .select(["REGION", "STATE", "REGION_TYPE", "PERIOD_END", "MEDIAN_SALE_PRICE"])
-            .filter(pl.col("REGION_TYPE").str.to_lowercase() == "zip code")
-            .with_columns([
-                pl.col("REGION")
-                .cast(pl.Utf8)
-                .str.replace_all(r"(?i)zip code:\s*", "")
-                .str.replace_all(r"\.0$", "")
-                .str.strip_chars()
-                .str.zfill(5)
-                .alias("ZIP"),
-                pl.col("PERIOD_END").str.slice(0, 4).alias("YEAR"),
-                pl.col("MEDIAN_SALE_PRICE").cast(pl.Float64),
-            ])
-            .collect()
-        )
-        print(f"✅ Loaded Redfin data with {self.redfin_df.shape[0]:,} rows.")
+        self.redfin_tsv_path = redfin_tsv_path
+        self.grab_zipmap()
+
+    def grab_zipmap(self):
+        """Downloads and extracts the SimpleMaps ZIP mapping (uszips.csv)."""
+        if not (self.temp_dir and self.temp_dir.exists()):
+            self.temp_dir = Path(tempfile.mkdtemp())
+        simplemaps_url = self.source_urls()[1]
 
-        # === 3. Download SimpleMaps ZIP dataset ===
         print("⬇️ Downloading SimpleMaps ZIP dataset...")
-        simplemaps_url = "https://simplemaps.com/static/data/us-zips/1.911/basic/simplemaps_uszips_basicv1.911.zip"
         zip_path = self.temp_dir / "uszips.zip"
 
         req = urllib.request.Request(
@@ -99,23 +94,61 @@ class RedfinProcessor(Processor):
             raise FileNotFoundError("Could not find 'uszips.csv' inside extracted ZIP directory.")
         print(f"✅ Found ZIP mapping → {zipmap_path}")
 
-        # === 4. Load SimpleMaps Data ===
-        self.zipmap = (
-            pl.read_csv(
-                zipmap_path,
-                columns=["zip", "city", "state_name", "state_id", "county_name"],
+        self.zipmap_path = zipmap_path
+        zipmap_rejected = (
+            pl.scan_csv(zipmap_path, infer_schema=False)
+            .pipe(apply_schema, "simplemaps")
+            .select(pl.col(REJECTED).sum())
+            .collect()
+            .item()
+        )
+        report_rejected("simplemaps", zipmap_rejected)
+
+    def zip_index(self, index_path):
+        """ZIP centroid index for the SimpleMaps release in use, rebuilt only when missing or stale."""
+        def build():
+            if not (self.zipmap_path and self.zipmap_path.exists()):
+                self.grab_zipmap()
+            print("🗺️ Building ZIP centroid index...")
+            return ZipIndex.from_simplemaps(self.zipmap_path)
+
+        return ZipIndex.load_or_build(index_path, self.source_urls()[1], build)
+
+    def zip_level(self):
+        """Lazily joins Redfin ZIP rows with SimpleMaps cities (ZIP-level, not yet aggregated)."""
+        # Every column is read as a string and typed by the schema registry (no inference)
+        redfin = (
+            pl.scan_csv(
+                self.redfin_tsv_path,
+                separator="\t",
+                null_values=["", "NA", "NaN"],
+                infer_schema=False,
             )
+            .select(["REGION", "STATE", "REGION_TYPE", "PERIOD_END", "MEDIAN_SALE_PRICE"])
             .with_columns(
-                pl.col("zip").cast(pl.Utf8).str.strip_chars().str.zfill(5),
-                pl.col("city").str.to_titlecase(),
+                pl.col("REGION")
+                .str.replace_all(r"(?i)zip code:\s*", "")
+                .str.replace_all(r"\.0$", "")
+                .alias("ZIP")
             )
+            # A REGION that does not hold a ZIP is rejected like any other unparseable cell
+            .pipe(apply_schema, "redfin")
+            .filter(pl.col("REGION_TYPE").cast(pl.Utf8).str.to_lowercase() == "zip code")
+            .with_columns(pl.col("PERIOD_END").dt.year().cast(pl.UInt16).alias("YEAR"))
         )
-        print(f"✅ Loaded SimpleMaps ZIP mapping ({self.zipmap.shape[0]:,} rows).")
 
-    def process(self):
-        """Merges Redfin and ZIP mapping data, aggregates to city-level."""
-        print("🔗 Merging Redfin ZIPs with SimpleMaps cities...")
-        merged = self.redfin_df.join(self.zipmap, left_on="ZIP", right_on="zip", how="left")
+        zipmap = (
+            pl.scan_csv(self.zipmap_path, infer_schema=False)
+            .select(["zip", "city", "state_name", "state_id", "county_name"])
+            .pipe(apply_schema, "simplemaps", ["zip", "city", "state_name", "state_id", "county_name"])
+            .filter(~pl.col(REJECTED))
+            .drop(REJECTED)
+            .with_columns(pl.col("city").str.to_titlecase())
+            # Sampling the ZIP map keeps only the sampled cities' ZIPs in the join below
+            .pipe(sample_filter, self.sample, pl.col("city"), pl.col("state_id"))
+        )
+
+        merged = redfin.join(zipmap, left_on="ZIP", right_on="zip", how="left")
 
         merged = merged.select([
             "ZIP",
@@ -125,49 +158,36 @@ class RedfinProcessor(Processor):
             pl.col("county_name").alias("COUNTY"),
             "YEAR",
             "MEDIAN_SALE_PRICE",
+            REJECTED,
         ])
 
-        merged = merged.filter(
-            pl.col("CITY").is_not_null() &
-            (pl.col("CITY") != "") &
-            pl.col("STATE").is_not_null() &
-            (pl.col("STATE") != "")
+        # Rejected rows have no city to join to; they stay so they are counted
+        return merged.filter(
+            (
+                pl.col("CITY").is_not_null() &
+                (pl.col("CITY") != "") &
+                pl.col("STATE").is_not_null() &
+                (pl.col("STATE").cast(pl.Utf8) != "")
+            ) | pl.col(REJECTED)
         )
 
-        print(f"✅ Cleaned merged dataset: {merged.shape[0]:,} rows.")
+    def process(self):
+        """Merges Redfin and ZIP mapping data, aggregates to city-level."""
+        print("🔗 Merging Redfin ZIPs with SimpleMaps cities...")
         print("📊 Aggregating by CITY, STATE, YEAR...")
-        city_agg = (
-            merged.group_by(["CITY", "STATE", "YEAR"])
-            .agg([
-                pl.col("MEDIAN_SALE_PRICE").mean().alias("avg_price"),
-                pl.count("ZIP").alias("zip_count"),
-            ])
-            .sort(["STATE", "CITY", "YEAR"])
-        )
+        return super().process()
 
-        self.data = city_agg
+    def finalize(self, partial):
+        """Builds the city-level output from (merged) partial aggregates."""
+        self.data = super().finalize(partial).sort(["STATE", "CITY", "YEAR"])
         print(f"✅ Created city-level aggregated DataFrame ({self.data.shape[0]:,} rows).")
 
-        # Cache for reuse
-        print(f"💾 Saving cached copy → {self.cache_path}")
-        self.data.write_csv(self.cache_path)
+        self.cleanup()
+        return self.data
 
-        # Cleanup
+    def cleanup(self):
+        if not (self.temp_dir and self.temp_dir.exists()):
+            return
         print("🧹 Cleaning up temporary files...")
-        if self.temp_dir and self.temp_dir.exists():
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
         print("✅ Temp files cleaned up.")
-        return self.data
-
-    def create_data(self):
-        """Use cached data if available."""
-        if self.cache_path.exists():
-            print(f"⚡ Using cached Redfin data from {self.cache_path}")
-            self.data = pl.read_csv(self.cache_path)
-            print(f"✅ Loaded cached Redfin data ({self.data.shape[0]:,} rows).")
-            return self.data
-
-        print("🚀 Cache not found — generating new Redfin dataset...")
-        self.grab_data()
-        self.process()
-        return self.data
@@ -0,0 +1,174 @@
+import polars as pl
+import polars.selectors as cs
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import zlib
+from files import write_atomic
+from sketches import merge_sketches
+
+# Partial aggregates are (sum, count) pairs rather than means: a mean of means
+# is not the mean, but sums and counts merge associatively across shards.
+
+
+def partial_aggregate(frame, keys, value_col, zip_col):
+    """Reduces ZIP-level rows to per-key partial aggregates (sum, count, ZIP rows)."""
+    return (
+        # Categorical keys are written as strings so partials from different processes concatenate
+        frame.with_columns(cs.categorical().cast(pl.Utf8))
+        .group_by(keys)
+        .agg([
+            pl.col(value_col).cast(pl.Float64).sum().alias("price_sum"),
+            pl.col(value_col).count().alias("price_count"),
+            pl.col(zip_col).count().alias("zip_rows"),
+        ])
+    )
+
+
+def merge_partials(partials, keys):
+    """Associative reducer: combines any number of partial aggregates into one."""
+    partials = [p.lazy() if isinstance(p, pl.DataFrame) else p for p in partials]
+    return (
+        pl.concat(partials)
+        .group_by(keys)
+        .agg([
+            pl.col("price_sum").sum(),
+            pl.col("price_count").sum(),
+            pl.col("zip_rows").sum(),
+        ])
+    )
+
+
+def finalize_partials(partial, keys):
+    """Turns merged partial aggregates into the (keys, avg_price, zip_count) output."""
+    return partial.select([
+        *keys,
+        pl.when(pl.col("price_count") > 0)
+        .then(pl.col("price_sum") / pl.col("price_count"))
+        .otherwise(None)
+        .cast(pl.Float64)
+        .alias("avg_price"),
+        pl.col("zip_rows").cast(pl.UInt32).alias("zip_count"),
+    ])
+
+
+def zip_price_partial(frame, zip_col, value_col):
+    """Per-(ZIP, YEAR) price sums and counts, the ZIP-level input to area aggregation."""
+    return (
+        frame.group_by([
+            pl.col(zip_col).cast(pl.UInt32, strict=False).alias("ZIP"),
+            pl.col("YEAR").cast(pl.Int32),
+        ])
+        .agg([
+            pl.col(value_col).cast(pl.Float64).sum().alias("price_sum"),
+            pl.col(value_col).count().alias("price_count"),
+        ])
+        .drop_nulls("ZIP")
+    )
+
+
+def merge_zip_prices(partials):
+    """Associative reducer for ZIP-year partials (across shards or sources)."""
+    partials = [p.lazy() if isinstance(p, pl.DataFrame) else p for p in partials]
+    return (
+        pl.concat(partials)
+        .group_by(["ZIP", "YEAR"])
+        .agg([pl.col("price_sum").sum(), pl.col("price_count").sum()])
+    )
+
+
+def state_shard(state, shard_count):
+    """Stable (process- and host-independent) shard number for a state name."""
+    return zlib.crc32(str(state).encode("utf-8")) % shard_count
+
+
+def _state_shards(states, shard_count):
+    mapping = {s: state_shard(s, shard_count) for s in states.drop_nulls().unique().to_list()}
+    return states.replace_strict(mapping, default=None, return_dtype=pl.UInt32)
+
+
+def shard_filter(frame, shard_index, shard_count, shard_by, zip_col, state_col):
+    """Keeps only the rows of `frame` that belong to shard `shard_index`."""
+    if shard_count <= 1:
+        return frame
+    if shard_by == "zip":
+        shard = pl.col(zip_col).cast(pl.UInt32, strict=False) % shard_count
+    elif shard_by == "state":
+        shard = pl.col(state_col).cast(pl.Utf8).map_batches(
+            lambda states: _state_shards(states, shard_count), return_dtype=pl.UInt32
+        )
+    else:
+        raise ValueError(f"❌ Unknown shard key '{shard_by}' (expected 'zip' or 'state')")
+    # Rows without a shard key still need exactly one home
+    return frame.filter(shard.fill_null(0) == shard_index)
+
+
+def shard_path(shard_dir, name, shard_index, shard_count, kind="part"):
+    return Path(shard_dir) / f"{name}-{kind}-{shard_index:05d}-of-{shard_count:05d}.arrow"
+
+
+def write_partial(partial, path):
+    """Writes a partial aggregate as compressed Arrow IPC, atomically."""
+    return write_atomic(path, lambda p: partial.write_ipc(p, compression="zstd"))
+
+
+def read_partials(shard_dir, name, shard_count, kind="part"):
+    """Loads every partial for `name` from a shared directory, failing if any shard is missing."""
+    paths = [shard_path(shard_dir, name, i, shard_count, kind) for i in range(shard_count)]
+    missing = [p.name for p in paths if not p.exists()]
+    if missing:
+        raise FileNotFoundError(f"❌ Missing {len(missing)} shard(s) in {shard_dir}: {', '.join(missing)}")
+    return [pl.scan_ipc(p) for p in paths]
+
+
+def run_shard(processor, shard_index, shard_count, shard_by, shard_dir):
+    """Worker entry point: computes one shard's partial aggregate and writes it to shard_dir."""
+    partial = processor.partial(shard_index, shard_count, shard_by)
+    path = write_partial(partial, shard_path(shard_dir, processor.name, shard_index, shard_count))
+    if processor.with_sketches:
+        sketch = processor.sketch(shard_index, shard_count, shard_by)
+        write_partial(sketch, shard_path(shard_dir, processor.name, shard_index, shard_count, "sketch"))
+    if processor.with_zip_prices:
+        zip_prices = processor.zip_partial(shard_index, shard_count, shard_by)
+        write_partial(zip_prices, shard_path(shard_dir, processor.name, shard_index, shard_count, "zip"))
+    print(f"✅ {processor.name} shard {shard_index + 1}/{shard_count}: {partial.shape[0]:,} groups → {path}")
+    return path
+
+
+def merge_shards(processor, shard_count, shard_dir):
+    """Reduces all partials in shard_dir and finalizes them on `processor`."""
+    print(f"🔗 Merging {shard_count} {processor.name} shard(s) from {shard_dir}...")
+    merged = merge_partials(read_partials(shard_dir, processor.name, shard_count), processor.group_keys)
+    if processor.with_sketches:
+        sketches = read_partials(shard_dir, processor.name, shard_count, "sketch")
+        processor.sketches = merge_sketches(sketches, processor.group_keys).collect()
+    if processor.with_zip_prices:
+        zip_prices = read_partials(shard_dir, processor.name, shard_count, "zip")
+        processor.zip_prices = merge_zip_prices(zip_prices).collect()
+    return processor.finalize(merged.collect())
+
+
+def run_sharded(processor, shard_count, shard_dir, shard_by="zip", workers=None):
+    """
+    Downloads once, fans the shards out across worker processes and merges the
+    partials. For multi-host runs, call `run_shard` on each host against a shared
+    directory and `merge_shards` once every shard has been written.
+    """
+    workers = workers or min(shard_count, os.cpu_count() or 1)
+    try:
+        processor.grab_data()
+        print(f"🚀 Running {processor.name} with {shard_count} shard(s) by {shard_by} on {workers} worker(s)...")
+        # Polars is multithreaded, so forking it can deadlock; always spawn workers
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(run_shard, processor, i, shard_count, shard_by, shard_dir)
+                for i in range(shard_count)
+            ]
+            for future in futures:
+                future.result()
+        return merge_shards(processor, shard_count, shard_dir)
+    finally:
+        # A failed worker must not leave the download behind
+        processor.cleanup()
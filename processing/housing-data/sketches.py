@@ -0,0 +1,77 @@
+import polars as pl
+import polars.selectors as cs
+import math
+
+# Log-bucketed quantile sketches (DDSketch-style). A value v lands in bucket
+# ceil(log_gamma(v)), so any quantile read back from the buckets is within
+# RELATIVE_ACCURACY of the true value. Sketches are plain (keys, bucket, count)
+# rows, which makes building and merging them ordinary vectorized group-bys.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# Caps memory per group; prices from $1 to $1B only need ~1,040 buckets
+MAX_BUCKETS = 2048
+DEFAULT_QUANTILES = (0.25, 0.5, 0.9)
+
+
+def build_sketches(frame, keys, value_col):
+    """Builds one sketch per key group from raw (positive) values."""
+    sketches = (
+        frame.filter(pl.col(value_col).is_not_null() & (pl.col(value_col) > 0))
+        .with_columns(cs.categorical().cast(pl.Utf8))
+        .with_columns(
+            (pl.col(value_col).cast(pl.Float64).log() / math.log(GAMMA)).ceil().cast(pl.Int16).alias("bucket")
+        )
+        .group_by([*keys, "bucket"])
+        .agg(pl.len().cast(pl.UInt32).alias("count"))
+    )
+    return _collapse(sketches, keys)
+
+
+def merge_sketches(sketches, keys):
+    """Associative merge of any number of sketch tables (across ZIPs, months or shards)."""
+    sketches = [s.lazy() if isinstance(s, pl.DataFrame) else s for s in sketches]
+    merged = (
+        pl.concat(sketches)
+        .group_by([*keys, "bucket"])
+        .agg(pl.col("count").sum().cast(pl.UInt32))
+    )
+    return _collapse(merged, keys)
+
+
+def _collapse(sketches, keys):
+    """Folds the lowest buckets of any group with more than MAX_BUCKETS into one."""
+    rank = pl.col("bucket").rank(method="ordinal", descending=True).over(keys)
+    floor = pl.col("bucket").filter(rank <= MAX_BUCKETS).min().over(keys)
+    return (
+        sketches.with_columns(pl.max_horizontal("bucket", floor).alias("bucket"))
+        .group_by([*keys, "bucket"])
+        .agg(pl.col("count").sum().cast(pl.UInt32))
+    )
+
+
+def sketch_quantiles(sketches, keys, quantiles=DEFAULT_QUANTILES):
+    """
+    Reads quantiles back out of sketches at any rollup level: `keys` may be any
+    subset of the sketch keys, e.g. ["State", "YEAR"] for statewide quantiles.
+    Returns one p<NN> column per quantile.
+    """
+    sketches = sketches.lazy() if isinstance(sketches, pl.DataFrame) else sketches
+    rolled = (
+        sketches.group_by([*keys, "bucket"])
+        .agg(pl.col("count").sum())
+        .sort([*keys, "bucket"])
+        .with_columns([
+            pl.col("count").cum_sum().over(keys).alias("cumulative"),
+            pl.col("count").sum().over(keys).alias("total"),
+        ])
+    )
+    # Bucket i covers (gamma^(i-1), gamma^i]; its midpoint is 2 * gamma^i / (gamma + 1)
+    midpoint = 2 * pl.lit(GAMMA).pow(pl.col("bucket").cast(pl.Float64)) / (GAMMA + 1)
+    return (
+        rolled.group_by(keys)
+        .agg([
+            midpoint.filter(pl.col("cumulative") > q * (pl.col("total") - 1)).first().alias(f"p{round(q * 100)}")
+            for q in quantiles
+        ])
+        .sort(keys)
+    )
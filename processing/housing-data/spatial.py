@@ -0,0 +1,220 @@
+"""
+Spatial ZIP Index
+=================
+A uniform grid over ZIP centroids projected onto the unit sphere (x, y, z),
+so straight-line (chord) distance orders points exactly like great-circle
+distance, with no seams at the antimeridian or the poles. Points are sorted by
+cell key; a batch of queries enumerates its candidate cells as one
+(queries × cells) key array, finds every cell's slice of the sorted points with
+a single searchsorted, and filters the expanded candidates by exact distance.
+Nothing loops per query or compares every query with every ZIP.
+"""
+
+import numpy as np
+import polars as pl
+from pathlib import Path
+from files import write_atomic
+from schemas import apply_schema, REJECTED
+
+EARTH_RADIUS_MILES = 3958.8
+DEFAULT_CELL_MILES = 10
+# Caps the (queries × candidate cells) key array built per batch
+MAX_BATCH_CELLS = 4_000_000
+
+
+def unit_vectors(lat, lng):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def miles_to_chord(miles):
+    return 2 * np.sin(np.minimum(miles / EARTH_RADIUS_MILES, np.pi) / 2)
+
+
+def chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class ZipIndex:
+    def __init__(self, zips, xyz, cell_size, source=""):
+        """
+        zips:      ZIP codes (UInt32), in any order
+        xyz:       (n, 3) unit vectors of their centroids
+        cell_size: grid cell edge, in chord units
+        source:    identifies the centroid data the index was built from
+        """
+        self.cell_size = float(cell_size)
+        self.source = source
+        # Cell coordinates are offset to be non-negative, then packed into one int64 key
+        self._offset = int(np.ceil(1 / self.cell_size)) + 1
+        self._dim = 2 * self._offset + 1
+        keys = self._keys(self._cells(xyz))
+        order = np.argsort(keys, kind="stable")
+        self.zips = np.asarray(zips, dtype=np.uint32)[order]
+        self.xyz = np.asarray(xyz, dtype=np.float64)[order]
+        self.keys = keys[order]
+
+    def _cells(self, xyz):
+        return np.floor(xyz / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        shifted = cells + self._offset
+        return (shifted[..., 0] * self._dim + shifted[..., 1]) * self._dim + shifted[..., 2]
+
+    # ------------------------------------------------------------------
+    # Construction and persistence
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_simplemaps(cls, zipmap_path, cell_miles=DEFAULT_CELL_MILES, source=""):
+        """Builds the index from the zip/lat/lng columns of SimpleMaps uszips.csv."""
+        centroids = (
+            pl.scan_csv(zipmap_path, infer_schema=False)
+            .select(["zip", "lat", "lng"])
+            .pipe(apply_schema, "simplemaps", ["zip", "lat", "lng"])
+            .filter(~pl.col(REJECTED))
+            .drop_nulls(["zip", "lat", "lng"])
+            .unique("zip", keep="first")
+            .collect()
+        )
+        return cls(
+            centroids["zip"].to_numpy(),
+            unit_vectors(centroids["lat"].to_numpy(), centroids["lng"].to_numpy()),
+            miles_to_chord(cell_miles),
+            source,
+        )
+
+    def save(self, path):
+        """Persists the sorted arrays as .npz (written atomically)."""
+        def write(tmp_path):
+            # Written through a handle so np.savez does not append .npz to the temp name
+            with open(tmp_path, "wb") as f:
+                np.savez(f, zips=self.zips, xyz=self.xyz, cell_size=self.cell_size, source=self.source)
+
+        return write_atomic(path, write)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["zips"], data["xyz"], float(data["cell_size"]), str(data["source"]))
+
+    @classmethod
+    def load_or_build(cls, path, source, build):
+        """Loads the index at `path` if it was built from `source`; otherwise calls `build()` and saves it."""
+        if Path(path).exists():
+            index = cls.load(path)
+            if index.source == source:
+                return index
+            print(f"♻️ ZIP index at {path} was built from other centroids; rebuilding...")
+        index = build()
+        index.source = source
+        index.save(path)
+        print(f"✅ Saved ZIP centroid index ({len(index.zips):,} ZIPs) → {path}")
+        return index
+
+    # ------------------------------------------------------------------
+    # Batch queries
+    # ------------------------------------------------------------------
+    def _offsets(self, chord):
+        """Cell offsets whose cells can hold a point within `chord` of a point in the center cell."""
+        reach = int(np.ceil(chord / self.cell_size))
+        axis = np.arange(-reach, reach + 1)
+        offsets = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+        gap = np.maximum(np.abs(offsets) - 1, 0) * self.cell_size
+        return offsets[np.sqrt((gap ** 2).sum(axis=1)) <= chord]
+
+    def _within(self, query_xyz, chord):
+        """(query index, point index, chord distance) for every point within `chord` of each query."""
+        reach = int(np.ceil(chord / self.cell_size))
+        if (2 * reach + 1) ** 3 >= len(self.keys):
+            # The radius spans about as many cells as there are ZIPs: every ZIP is a candidate
+            offsets = None
+            batch = max(1, MAX_BATCH_CELLS // max(len(self.keys), 1))
+        else:
+            offsets = self._offsets(chord)
+            batch = max(1, MAX_BATCH_CELLS // len(offsets))
+        results = [(np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0))]
+        for start in range(0, len(query_xyz), batch):
+            q = query_xyz[start:start + batch]
+            if offsets is None:
+                query = np.repeat(np.arange(len(q)), len(self.keys))
+                point = np.tile(np.arange(len(self.keys)), len(q))
+            else:
+                keys = self._keys(self._cells(q)[:, None, :] + offsets[None, :, :])
+                lo = np.searchsorted(self.keys, keys, side="left").ravel()
+                counts = np.searchsorted(self.keys, keys, side="right").ravel() - lo
+                # Expand each (query, cell) slice [lo, lo + count) into flat candidate rows
+                query = np.repeat(np.repeat(np.arange(len(q)), len(offsets)), counts)
+                run_start = np.repeat(np.cumsum(counts) - counts, counts)
+                point = np.repeat(lo, counts) + np.arange(counts.sum()) - run_start
+            distance = np.sqrt(((self.xyz[point] - q[query]) ** 2).sum(axis=1))
+            keep = distance <= chord
+            results.append((query[keep] + start, point[keep], distance[keep]))
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    def radius(self, lat, lng, miles):
+        """Every ZIP within `miles` of each (lat, lng): DataFrame(query, ZIP, distance_miles)."""
+        query, point, chord = self._within(unit_vectors(lat, lng), miles_to_chord(miles))
+        return pl.DataFrame({
+            "query": query.astype(np.uint32),
+            "ZIP": self.zips[point],
+            "distance_miles": chord_to_miles(chord),
+        })
+
+    def nearest(self, lat, lng, k):
+        """The k nearest ZIPs to each (lat, lng): DataFrame(query, ZIP, distance_miles, rank)."""
+        query_xyz = unit_vectors(lat, lng)
+        k = min(k, len(self.zips))
+        pending = np.arange(len(query_xyz))
+        chord = 2 * self.cell_size
+        found = []
+        # Grow the search radius until every query has k candidates; the k nearest
+        # are then guaranteed to be among them
+        while len(pending):
+            query, point, distance = self._within(query_xyz[pending], chord)
+            done = np.bincount(query, minlength=len(pending)) >= k
+            if chord >= 2:
+                done[:] = True
+            keep = done[query]
+            found.append((pending[query[keep]], point[keep], distance[keep]))
+            pending = pending[~done]
+            chord *= 2
+        query, point, distance = (np.concatenate(parts) for parts in zip(*found))
+        order = np.lexsort((distance, query))
+        query, point, distance = query[order], point[order], distance[order]
+        starts = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+        rank = np.arange(len(query)) - np.repeat(starts, np.diff(np.r_[starts, len(query)]))
+        keep = rank < k
+        return pl.DataFrame({
+            "query": query[keep].astype(np.uint32),
+            "ZIP": self.zips[point[keep]],
+            "distance_miles": chord_to_miles(distance[keep]),
+            "rank": (rank[keep] + 1).astype(np.uint32),
+        })
+
+
+def area_prices(matches, queries, zip_prices):
+    """
+    Joins (query, ZIP) matches to ZIP-year price partials and averages them per
+    query and year. `queries` rows are numbered in order; their columns are kept.
+    A query with no priced ZIP in range keeps one row with a null YEAR and
+    avg_price and a zip_count of 0, so "no data" is distinguishable from "not queried".
+    """
+    prices = (
+        matches.lazy()
+        .join(zip_prices.lazy(), on="ZIP", how="inner")
+        .group_by(["query", "YEAR"])
+        .agg([
+            (pl.col("price_sum").sum() / pl.col("price_count").sum()).alias("avg_price"),
+            pl.col("ZIP").n_unique().cast(pl.UInt32).alias("zip_count"),
+            pl.col("distance_miles").max().alias("max_distance_miles"),
+        ])
+    )
+    return (
+        queries.lazy().with_row_index("query")
+        .join(prices, on="query", how="left")
+        .with_columns(pl.col("zip_count").fill_null(0))
+        .sort(["query", "YEAR"], nulls_last=True)
+        .select([*queries.columns, "YEAR", "avg_price", "zip_count", "max_distance_miles"])
+        .collect()
+    )
@@ -2,83 +2,107 @@ import polars as pl
 from pathlib import Path
 import requests
 import tempfile
+import shutil
 import os
 from processor import Processor
+from schemas import apply_schema, REJECTED
+from upstream import upstream_url
+from sampling import sample_filter
 
 class ZillowProcessor(Processor):
-    def __init__(self):
-        super().__init__()
+    name = "zillow"
+    group_keys = ["City", "State", "YEAR"]
+    value_col = "ZHVI"
+    zip_col = "RegionName"
+    state_col = "State"
+
+    url = "https://files.zillowstatic.com/research/public_csvs/zhvi/Zip_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv"
+
+    def __init__(self, with_sketches=False, cache=True, with_zip_prices=False, sample=None):
+        super().__init__(with_sketches, cache, with_zip_prices, sample)
         self.data = None
+        self.temp_dir = None
         self.temp_file = None
 
+    def source_urls(self):
+        return [upstream_url(self.url)]
+
     def grab_data(self):
-        url = "https://files.zillowstatic.com/research/public_csvs/zhvi/Zip_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv"
-        temp_dir = tempfile.gettempdir()
-        self.temp_file = Path(temp_dir) / "zillow_raw.csv"
+        # A private temp directory per run, so concurrent runs never share a download path
+        self.temp_dir = Path(tempfile.mkdtemp(prefix="zillow-"))
+        self.temp_file = self.temp_dir / "zillow_raw.csv"
 
         print("Downloading Zillow data...")
-        response = requests.get(url)
+        response = requests.get(self.source_urls()[0])
         response.raise_for_status()
-        with open(self.temp_file, "wb") as f:
+        partial_file = self.temp_file.with_suffix(".part")
+        with open(partial_file, "wb") as f:
             f.write(response.content)
+        os.replace(partial_file, self.temp_file)
         print(f"Download complete → {self.temp_file}")
 
-        print("Reading CSV into Polars...")
-        self.data = pl.read_csv(self.temp_file, ignore_errors=True)
-
-    def process(self):
-        print("Processing Zillow data...")
+    def zip_level(self):
+        """Lazily melts the wide Zillow CSV into valid ZIP-month rows."""
+        # Read as strings; the schema registry types each cell (no inference)
+        raw = pl.scan_csv(self.temp_file, infer_schema=False)
+        # One row per ZIP, so sampling before the melt skips most of the work
+        sampled = sample_filter(raw, self.sample, pl.col("City"), pl.col("State"))
 
         # Identify date columns (those starting with 4 digits)
-        date_cols = [c for c in self.data.columns if c[:4].isdigit()]
+        date_cols = [c for c in raw.collect_schema().names() if c[:4].isdigit()]
         if not date_cols:
             raise ValueError("❌ Could not identify date columns — check the Zillow CSV headers!")
 
-        # Melt the dataframe (wide → long format)
-        melted = (
-            self.data.melt(
-                id_vars=["RegionName", "City", "State"],
-                value_vars=date_cols,
+        id_cols = ["RegionName", "City", "State"]
+        return (
+            # The ID columns are typed once per ZIP row, before the melt multiplies them
+            sampled.pipe(apply_schema, "zillow", id_cols)
+            .rename({REJECTED: "_id_rejected"})
+            # Melt the dataframe (wide → long format)
+            .unpivot(
+                index=[*id_cols, "_id_rejected"],
+                on=date_cols,
                 variable_name="Date",
                 value_name="ZHVI"
             )
+            .pipe(apply_schema, "zillow", ["ZHVI"])
             .with_columns([
+                (pl.col(REJECTED) | pl.col("_id_rejected")).alias(REJECTED),
                 # Extract year from the first 4 characters of the column name
-                pl.col("Date").str.extract(r"(\d{4})").cast(pl.Int32).alias("YEAR"),
-                pl.col("ZHVI").cast(pl.Float64),
-                # Normalize text fields (strip spaces, lowercase "nan")
-                pl.col("City").cast(pl.Utf8).str.strip_chars().alias("City"),
-                pl.col("State").cast(pl.Utf8).str.strip_chars().alias("State"),
+                pl.col("Date").str.extract(r"(\d{4})").cast(pl.UInt16).alias("YEAR"),
             ])
+            .drop("_id_rejected")
             # Filter invalid entries (City, State, YEAR)
             .filter(
                 (pl.col("City").is_not_null()) &
                 (pl.col("City").str.strip_chars() != "") &
                 (~pl.col("City").str.to_lowercase().is_in(["nan", "none"])) &
                 (pl.col("State").is_not_null()) &
-                (pl.col("State").str.strip_chars() != "") &
-                (~pl.col("State").str.to_lowercase().is_in(["nan", "none"])) &
+                (pl.col("State").cast(pl.Utf8) != "") &
+                (~pl.col("State").cast(pl.Utf8).str.to_lowercase().is_in(["nan", "none"])) &
                 (pl.col("YEAR").is_not_null()) &
                 (pl.col("YEAR") > 1900)
             )
+            # Empty cells are dropped; cells that failed to parse stay so they are counted as rejected
+            .filter(pl.col("ZHVI").is_not_null() | pl.col(REJECTED))
         )
 
-        print(f"✅ Zillow valid rows after cleaning: {melted.shape[0]:,}")
-
+    def process(self):
+        print("Processing Zillow data...")
         # Average across ZIPs within city per year
-        city_year_avg = (
-            melted
-            .filter(pl.col("ZHVI").is_not_null())
-            .group_by(["City", "State", "YEAR"])
-            .agg([
-                pl.col("ZHVI").mean().alias("avg_price"),
-                pl.count("RegionName").alias("zip_count"),
-            ])
+        return super().process()
+
+    def finalize(self, partial):
+        """Builds the city-level output from (merged) partial aggregates."""
+        self.data = (
+            super().finalize(partial)
             .filter(pl.col("avg_price").is_not_null())
             .sort(["State", "City", "YEAR"])
         )
-
-        self.data = city_year_avg
         print(f"✅ Created Zillow DataFrame ({self.data.shape[0]:,} rows).")
-        os.remove(self.temp_file)
+        self.cleanup()
         return self.data
+
+    def cleanup(self):
+        if self.temp_dir and self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
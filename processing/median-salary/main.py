@@ -1,8 +1,28 @@
 import pandas as pd
+import polars as pl
 import requests
+import argparse
 import os
+import sys
+from pathlib import Path
 from tqdm import tqdm
 
+# The shared schema registry lives one level up in processing/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from schemas import apply_schema, split_rejected, report_rejected
+from changefeed import publish_changes
+from handoff import publish
+from upstream import upstream_url
+from sampling import sample_filter, sample_fraction, sampled_name, sampled_path
+from states import STATE_MAP, PLACE_SUFFIX
+
+parser = argparse.ArgumentParser(description="Download ACS 1-year median household income by place.")
+parser.add_argument("--sample", type=sample_fraction, default=None, metavar="FRACTION",
+                    help="Keep a deterministic, per-state sample of places (e.g. 0.01 or 1%%)")
+args = parser.parse_args()
+if args.sample:
+    print(f"🧪 Sampled preview run ({args.sample * 100:g}% of places): outputs are not the full dataset")
+
 # Directory to save results
 data_dir = "../../processed-data/median-salary"
 os.makedirs(data_dir, exist_ok=True)
@@ -14,7 +34,7 @@ years = range(2010, 2024)
 var = "S1901_C01_012E"
 
 # Base URL pattern (ACS 1-Year Subject Tables)
-base_url = "https://api.census.gov/data/{year}/acs/acs1/subject"
+base_url = upstream_url("https://api.census.gov/data/{year}/acs/acs1/subject")
 
 all_dfs = []
 
@@ -30,13 +50,20 @@ for year in tqdm(years, desc="Downloading ACS data"):
         r.raise_for_status()
         data = r.json()
 
-        # First row is headers
+        # First row is headers; values stay strings until the schema registry types them
         cols = data[0]
-        df = pd.DataFrame(data[1:], columns=cols)
-        df[var] = pd.to_numeric(df[var], errors="coerce")
-        df["Year"] = year
+        df = pl.DataFrame(data[1:], schema=cols, orient="row").with_columns(pl.lit(str(year)).alias("Year"))
+        df, rejected = split_rejected(apply_schema(df, "acs"))
+        report_rejected(f"acs {year}", rejected)
+        # Same place key as the housing processors ("Albany city, New York" → Albany|NY)
+        df = sample_filter(
+            df,
+            args.sample,
+            pl.col("NAME").str.extract(r"^(.*?),").str.replace(PLACE_SUFFIX, ""),
+            pl.col("NAME").str.extract(r",\s*([^,]+)$").replace_strict(STATE_MAP, default=None),
+        )
 
-        all_dfs.append(df)
+        all_dfs.append(df.to_pandas())
 
     except Exception as e:
         print(f"Error downloading {year}: {e}")
@@ -53,7 +80,8 @@ combined_df["State"] = city_state[1].str.strip()
 combined_df = combined_df[["City", "State", "Year", var]]
 combined_df = combined_df.rename(columns={var: "Median_Income"})
 
-# Save combined data
-out_path = os.path.join(data_dir, "acs1y_s1901_median_income_2010_2023.csv")
+# Save combined data (Arrow handoff for later stages, CSV as the export format)
+publish(sampled_name("acs1y_s1901_median_income", args.sample), combined_df)
+out_path = sampled_path(os.path.join(data_dir, "acs1y_s1901_median_income_2010_2023.csv"), args.sample)
 combined_df.to_csv(out_path, index=False)
-
+publish_changes(combined_df, sampled_name("acs1y_s1901_median_income", args.sample), ["State", "City", "Year"])
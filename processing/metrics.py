@@ -0,0 +1,124 @@
+"""
+Derived Metrics
+===============
+Growth, CAGR, rolling statistics, PCE-deflated (real) values and per-year
+percentile ranks for the city-year tables, computed with polars window
+functions in a single lazy query per table. Rows are sorted by place and year
+once, so every `.over(place)` window sees each place's years in order; a
+lag is only used when the years it spans are contiguous.
+"""
+
+import polars as pl
+from states import align_acs_places
+
+PLACE = ["State", "City"]
+ROLLING_YEARS = 3
+CAGR_YEARS = 5
+
+
+def deflator(spending):
+    """Per-year PCE inflation factor (nominal / real, 1.0 in the 2017 base year)."""
+    return _lazy(spending).select([
+        pl.col("year").cast(pl.Int64).alias("YEAR"),
+        (pl.col("nominal_consumer_spending") / pl.col("real_consumer_spending")).alias("inflation_factor"),
+    ]).drop_nulls("inflation_factor")
+
+
+def _lag(column, years, keys):
+    """`column` from `years` rows earlier in the same place, only if that row is exactly `years` years back."""
+    contiguous = (pl.col("YEAR") - pl.col("YEAR").shift(years).over(keys)) == years
+    return pl.when(contiguous).then(pl.col(column).shift(years).over(keys))
+
+
+def growth_metrics(frame, value, keys=PLACE):
+    """
+    Adds YoY growth, CAGR, rolling mean/volatility, the real (2017-dollar) value
+    and per-year percentile rank of `value`. `frame` must already carry the
+    inflation_factor column.
+    """
+    window_ok = (
+        (pl.col("YEAR") - pl.col("YEAR").shift(ROLLING_YEARS - 1).over(keys)) == ROLLING_YEARS - 1
+    )
+    return (
+        frame.sort([*keys, "YEAR"])
+        .with_columns([
+            (pl.col(value) / _lag(value, 1, keys) - 1).alias(f"{value}_yoy"),
+            ((pl.col(value) / _lag(value, CAGR_YEARS, keys)).pow(1 / CAGR_YEARS) - 1)
+            .alias(f"{value}_cagr_{CAGR_YEARS}y"),
+            pl.when(window_ok)
+            .then(pl.col(value).rolling_mean(ROLLING_YEARS).over(keys))
+            .alias(f"{value}_rolling_mean_{ROLLING_YEARS}y"),
+            (pl.col(value) / pl.col("inflation_factor")).alias(f"real_{value}"),
+            (pl.col(value).rank("average").over("YEAR") / pl.col(value).count().over("YEAR"))
+            .alias(f"{value}_pct_rank"),
+        ])
+        .with_columns(
+            pl.when(window_ok)
+            .then(pl.col(f"{value}_yoy").rolling_std(ROLLING_YEARS).over(keys))
+            .alias(f"{value}_volatility_{ROLLING_YEARS}y")
+        )
+    )
+
+
+def _lazy(frame):
+    if isinstance(frame, pl.LazyFrame):
+        return frame
+    return (frame if isinstance(frame, pl.DataFrame) else pl.from_pandas(frame)).lazy()
+
+
+def city_income(income):
+    """ACS income aligned to housing places, one row per (State, City, YEAR)."""
+    return (
+        align_acs_places(_lazy(income))
+        .group_by([*PLACE, "YEAR"])
+        .agg(pl.col("Median_Income").cast(pl.Float64).mean())
+    )
+
+
+def housing_metrics(housing, income, spending):
+    """City-year housing metrics, plus income and affordability where ACS covers the place."""
+    frame = (
+        _lazy(housing).with_columns(pl.col("YEAR").cast(pl.Int64))
+        .join(deflator(spending), on="YEAR", how="left")
+        .join(city_income(income), on=[*PLACE, "YEAR"], how="left")
+        .with_columns((pl.col("avg_price") / pl.col("Median_Income")).alias("price_to_income_ratio"))
+    )
+    return (
+        growth_metrics(frame, "avg_price")
+        .with_columns(
+            # Higher rank = less affordable relative to the other cities that year
+            (pl.col("price_to_income_ratio").rank("average").over("YEAR")
+             / pl.col("price_to_income_ratio").count().over("YEAR")).alias("affordability_pct_rank")
+        )
+        .collect()
+    )
+
+
+def income_metrics(income, spending):
+    """City-year median income metrics (ACS places, housing naming convention)."""
+    frame = city_income(income).join(deflator(spending), on="YEAR", how="left")
+    return growth_metrics(frame, "Median_Income").collect()
+
+
+def state_income_metrics(income, spending):
+    """State-year mean of city median incomes, with the same growth metrics."""
+    frame = (
+        _lazy(income)
+        .group_by(["State", pl.col("Year").cast(pl.Int64).alias("YEAR")])
+        .agg(pl.col("Median_Income").cast(pl.Float64).mean())
+        .join(deflator(spending), on="YEAR", how="left")
+    )
+    return growth_metrics(frame, "Median_Income", keys=["State"]).collect()
+
+
+def spending_metrics(spending):
+    """National PCE series with the inflation factor and its YoY change."""
+    return (
+        _lazy(spending)
+        .sort("year")
+        .with_columns(
+            (pl.col("nominal_consumer_spending") / pl.col("real_consumer_spending")).alias("inflation_factor")
+        )
+        .with_columns((pl.col("inflation_factor") / pl.col("inflation_factor").shift(1) - 1).alias("inflation_yoy"))
+        .collect()
+    )
@@ -0,0 +1,197 @@
+"""
+Housing Panel
+=============
+Dense place × year matrices for the housing, income and spending datasets.
+Each place gets one row (looked up through a place dictionary), each year one
+column, so per-city time series, per-year cross sections and cross-dataset
+arithmetic are NumPy slicing and matrix ops instead of string filters and joins.
+Missing cells are NaN, with a bit-packed validity mask per metric, so each
+cell costs ~8 bytes.
+"""
+
+import numpy as np
+import polars as pl
+from handoff import load
+from states import align_acs_places
+
+
+class HousingPanel:
+    def __init__(self, places, years, metrics, national=None):
+        """
+        places:   polars DataFrame (City, State) whose row number is the place index
+        years:    1D array of consecutive years (column index = year - years[0])
+        metrics:  {name: float64 array of shape (len(places), len(years))}, NaN = missing
+        national: {name: float64 array of shape (len(years),)} for place-independent series
+        """
+        self.places = places
+        self.years = np.asarray(years)
+        self.metrics = metrics
+        self.national = national or {}
+        self._masks = {name: np.packbits(~np.isnan(values), axis=1) for name, values in metrics.items()}
+        self._place_index = {
+            key: i for i, key in enumerate(zip(places["City"].to_list(), places["State"].to_list()))
+        }
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _dense(frame, places, years, column):
+        """Scatters (City, State, YEAR, column) rows into a places × years matrix, averaging duplicates."""
+        rows = frame.join(places.with_row_index("_row"), on=["City", "State"], how="inner")
+        flat = (rows["_row"].to_numpy().astype(np.int64) * len(years)
+                + rows["YEAR"].to_numpy().astype(np.int64) - years[0])
+        values = rows[column].cast(pl.Float64).to_numpy()
+        present = ~np.isnan(values)
+        size = len(places) * len(years)
+        sums = np.bincount(flat[present], weights=values[present], minlength=size)
+        counts = np.bincount(flat[present], minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dense = np.where(counts > 0, sums / counts, np.nan)
+        return dense.reshape(len(places), len(years))
+
+    @classmethod
+    def from_frames(cls, housing, income=None, spending=None):
+        """Builds the panel from long-format frames (polars or pandas)."""
+        def as_polars(frame):
+            return frame if frame is None or isinstance(frame, pl.DataFrame) else pl.from_pandas(frame)
+
+        housing = as_polars(housing).with_columns(pl.col("YEAR").cast(pl.Int64))
+        income = as_polars(income)
+        spending = as_polars(spending)
+        if income is not None:
+            income = align_acs_places(income)
+
+        key_frames = [housing.select(["City", "State"])]
+        year_values = [housing["YEAR"]]
+        if income is not None:
+            key_frames.append(income.select(["City", "State"]))
+            year_values.append(income["YEAR"])
+        places = pl.concat(key_frames).unique().sort(["State", "City"])
+        all_years = pl.concat(year_values).drop_nulls()
+        years = np.arange(all_years.min(), all_years.max() + 1)
+
+        metrics = {
+            "avg_price": cls._dense(housing, places, years, "avg_price"),
+            "zip_count": cls._dense(housing, places, years, "zip_count"),
+        }
+        if income is not None:
+            metrics["median_income"] = cls._dense(income, places, years, "Median_Income")
+
+        national = {}
+        if spending is not None:
+            spending = spending.filter(pl.col("year").is_between(years[0], years[-1]))
+            cols = (spending["year"].to_numpy() - years[0]).astype(np.int64)
+            for name in ("real_consumer_spending", "nominal_consumer_spending"):
+                series = np.full(len(years), np.nan)
+                series[cols] = spending[name].cast(pl.Float64).to_numpy()
+                national[name] = series
+        return cls(places, years, metrics, national)
+
+    @classmethod
+    def load(cls):
+        """Builds the panel from the datasets published by the processing stages."""
+        return cls.from_frames(
+            load("housing_prices_city_aggregated"),
+            load("acs1y_s1901_median_income"),
+            load("us_consumer_spending"),
+        )
+
+    # ------------------------------------------------------------------
+    # O(1) lookups and slices (views into the matrices, no copies)
+    # ------------------------------------------------------------------
+    def place(self, city, state):
+        return self._place_index[(city, state)]
+
+    def year(self, year):
+        index = int(year) - int(self.years[0])
+        if not 0 <= index < len(self.years):
+            raise KeyError(f"❌ Year {year} is outside the panel ({self.years[0]}-{self.years[-1]})")
+        return index
+
+    def __getitem__(self, metric):
+        return self.metrics[metric] if metric in self.metrics else self.national[metric]
+
+    def series(self, metric, city, state):
+        """One place's values across all years."""
+        return self.metrics[metric][self.place(city, state)]
+
+    def cross_section(self, metric, year):
+        """Every place's value in one year."""
+        return self.metrics[metric][:, self.year(year)]
+
+    def value(self, metric, city, state, year):
+        return self.metrics[metric][self.place(city, state), self.year(year)]
+
+    # ------------------------------------------------------------------
+    # Vectorized analytics
+    # ------------------------------------------------------------------
+    def mask(self, metric):
+        """Boolean places × years validity mask of a metric."""
+        return np.unpackbits(self._masks[metric], axis=1, count=len(self.years)).astype(bool)
+
+    def add(self, name, values):
+        """Registers a derived places × years matrix (e.g. the result of `ratio`)."""
+        self.metrics[name] = values
+        self._masks[name] = np.packbits(~np.isnan(values), axis=1)
+        return values
+
+    def ratio(self, numerator, denominator):
+        """Element-wise ratio of two metrics (or a metric over a national series), NaN where undefined."""
+        den = self[denominator]
+        den = den if den.ndim == 2 else den[np.newaxis, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(den != 0, self[numerator] / den, np.nan)
+
+    def yoy(self, metric):
+        """Year-over-year fractional change; the first year is NaN."""
+        values = self.metrics[metric]
+        change = np.full_like(values, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            change[:, 1:] = values[:, 1:] / values[:, :-1] - 1
+        return change
+
+    def top_n(self, metric, year, n=10, ascending=False):
+        """The n places with the highest (or lowest) value in `year`, as a DataFrame."""
+        column = self.cross_section(metric, year)
+        valid = np.flatnonzero(~np.isnan(column))
+        order = np.argsort(column[valid])
+        picked = valid[order[:n] if ascending else order[::-1][:n]]
+        return self.places[picked].with_columns(pl.Series(metric, column[picked]))
+
+    def top_cells(self, metric, n=10, ascending=False, where=None):
+        """
+        The n highest (or lowest) place-year cells of a metric across all years,
+        optionally restricted to a boolean places × years `where` mask.
+        """
+        values = self[metric]
+        valid = ~np.isnan(values) if where is None else ~np.isnan(values) & where
+        rows, cols = np.nonzero(valid)
+        picked = values[rows, cols]
+        order = np.argsort(picked, kind="stable")
+        order = (order if ascending else order[::-1])[:n]
+        return self.places[rows[order]].with_columns([
+            pl.Series("YEAR", self.years[cols[order]]),
+            pl.Series(metric, picked[order]),
+        ])
+
+    def to_long(self, metrics=None):
+        """Back to long format: one (City, State, YEAR, metrics...) row per valid cell."""
+        metrics = metrics or list(self.metrics)
+        rows, cols = np.nonzero(np.logical_or.reduce([self.mask(m) for m in metrics]))
+        return self.places[rows].with_columns([
+            pl.Series("YEAR", self.years[cols]),
+            *[pl.Series(m, self.metrics[m][rows, cols]) for m in metrics],
+        ])
+
+    @property
+    def nbytes(self):
+        arrays = [*self.metrics.values(), *self._masks.values(), *self.national.values()]
+        return sum(a.nbytes for a in arrays)
+
+    def __repr__(self):
+        return (
+            f"HousingPanel({len(self.places):,} places × {len(self.years)} years "
+            f"[{self.years[0]}-{self.years[-1]}], metrics={list(self.metrics)}, "
+            f"{self.nbytes / 1024 ** 2:.1f} MB)"
+        )
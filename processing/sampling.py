@@ -0,0 +1,118 @@
+"""
+Sampled Preview Runs
+====================
+`--sample FRACTION` keeps a deterministic subset of places in every stage,
+stratified by state. Every source is sampled from one shared place list (the
+distinct city/state_id pairs of the SimpleMaps release in use): within each
+state, places (title-cased city + USPS state) are ranked by a stable CRC32 of
+their name and the first ceil(FRACTION × places in the state) are kept. Each
+state keeps at least one place, and Redfin, Zillow and ACS apply the same kept
+set, so their joins still line up and every kept city keeps all of its ZIPs.
+Places missing from the SimpleMaps list are never sampled.
+
+Sampled outputs are written under their own names (`..._sample_1pct`), so a
+preview run never overwrites or diffs against the full datasets.
+"""
+
+import polars as pl
+from functools import lru_cache
+from pathlib import Path
+import io
+import urllib.request
+import zipfile
+import zlib
+from files import write_atomic
+from upstream import upstream_url, USER_AGENT, SIMPLEMAPS_URL
+
+# Changing the salt picks a different (equally deterministic) sample
+SAMPLE_SALT = "housing-sample-v1"
+
+# Place lists, one per SimpleMaps release and host, shared by every stage
+PLACES_DIR = Path(__file__).resolve().parent / "sample_places"
+
+
+def _stable_hash(keys):
+    mapping = {k: zlib.crc32(f"{SAMPLE_SALT}:{k}".encode("utf-8")) for k in keys.drop_nulls().unique().to_list()}
+    return keys.replace_strict(mapping, default=None, return_dtype=pl.UInt32)
+
+
+def _place_key(city, state):
+    return pl.concat_str([
+        city.cast(pl.Utf8).str.strip_chars().str.to_titlecase(),
+        state.cast(pl.Utf8).str.strip_chars().str.to_uppercase(),
+    ], separator="|")
+
+
+def place_list():
+    """Distinct places (key "City|ST", state) of the SimpleMaps release in use, downloaded once."""
+    url = upstream_url(SIMPLEMAPS_URL)
+    path = PLACES_DIR / f"places-{zlib.crc32(url.encode('utf-8')):08x}.parquet"
+    if path.exists():
+        return pl.read_parquet(path)
+    print("⬇️ Downloading the SimpleMaps place list to sample from...")
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(req) as response:
+        archive = zipfile.ZipFile(io.BytesIO(response.read()))
+    member = next((n for n in archive.namelist() if n.endswith("uszips.csv")), None)
+    if not member:
+        raise FileNotFoundError("Could not find 'uszips.csv' inside the SimpleMaps archive.")
+    places = (
+        pl.read_csv(archive.read(member), columns=["city", "state_id"], infer_schema=False)
+        .select([
+            _place_key(pl.col("city"), pl.col("state_id")).alias("key"),
+            pl.col("state_id").str.strip_chars().str.to_uppercase().alias("state"),
+        ])
+        .drop_nulls()
+        .unique()
+        .sort("key")
+    )
+    write_atomic(path, places.write_parquet)
+    return places
+
+
+@lru_cache(maxsize=None)
+def sample_keys(fraction):
+    """Keys of the places kept by a `fraction` sample: the ceil(fraction × n) lowest-hash places of each state."""
+    places = place_list()
+    per_state = (pl.len().over("state") * fraction).round(9).ceil()
+    return (
+        places.with_columns(_stable_hash(places["key"]).alias("hash"))
+        # Ties (CRC collisions) are broken by key, since the list is sorted by key
+        .filter(pl.col("hash").rank("ordinal").over("state") <= per_state)
+        ["key"]
+    )
+
+
+def sample_filter(frame, fraction, city, state):
+    """
+    Keeps the rows of `frame` whose place is in the sample. `city` and `state`
+    are expressions for the place's city name and USPS state abbreviation.
+    """
+    if not fraction or fraction >= 1:
+        return frame
+    return frame.filter(_place_key(city, state).is_in(sample_keys(fraction).implode()))
+
+
+def sample_label(fraction):
+    return f"sample_{fraction * 100:g}pct"
+
+
+def sampled_name(name, fraction):
+    """Dataset name for a (possibly) sampled run: unchanged for full runs."""
+    return f"{name}_{sample_label(fraction)}" if fraction else name
+
+
+def sampled_path(path, fraction):
+    """Output path for a (possibly) sampled run, e.g. data.csv → data_sample_1pct.csv."""
+    if not fraction:
+        return path
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}_{sample_label(fraction)}{path.suffix}"))
+
+
+def sample_fraction(value):
+    """argparse type for --sample: a fraction in (0, 1], also accepting percentages like '1%'."""
+    fraction = float(value[:-1]) / 100 if value.endswith("%") else float(value)
+    if not 0 < fraction <= 1:
+        raise ValueError(f"❌ --sample must be in (0, 1] or a percentage, got {value}")
+    return fraction
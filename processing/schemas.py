@@ -0,0 +1,96 @@
+"""
+Schema Registry
+===============
+Exact column dtypes for every upstream source. Parsers read the declared
+columns as raw strings (no inference) and convert them here, so a value that
+does not fit its dtype is counted and rejected instead of silently turning
+into a null.
+"""
+
+import polars as pl
+
+# Sentinel column added by apply_schema; True where any declared column failed to parse
+REJECTED = "_rejected"
+
+SCHEMAS = {
+    # Redfin ZIP Code Market Tracker (TSV)
+    "redfin": {
+        "REGION": pl.Utf8,
+        "REGION_TYPE": pl.Categorical,
+        "STATE": pl.Categorical,
+        "PERIOD_END": pl.Date,
+        "MEDIAN_SALE_PRICE": pl.Float32,
+        # Parsed out of REGION ("Zip Code: 02139")
+        "ZIP": pl.UInt32,
+    },
+    # SimpleMaps uszips.csv
+    "simplemaps": {
+        "zip": pl.UInt32,
+        "city": pl.Utf8,
+        "state_id": pl.Categorical,
+        "state_name": pl.Categorical,
+        "county_name": pl.Utf8,
+        "lat": pl.Float64,
+        "lng": pl.Float64,
+    },
+    # Zillow ZHVI, after melting the monthly columns into ZHVI
+    "zillow": {
+        "RegionName": pl.UInt32,
+        "City": pl.Utf8,
+        "State": pl.Categorical,
+        "ZHVI": pl.Float32,
+    },
+    # ACS 1-Year S1901 (Census API JSON rows)
+    "acs": {
+        "NAME": pl.Utf8,
+        "S1901_C01_012E": pl.UInt32,
+        "Year": pl.UInt16,
+    },
+    # FRED series CSV, after renaming to date/value
+    "fred": {
+        "date": pl.Date,
+        "value": pl.Float64,
+    },
+}
+
+
+def _parse(column, dtype):
+    raw = pl.col(column).cast(pl.Utf8).str.strip_chars()
+    if dtype == pl.Date:
+        return raw.str.to_date("%Y-%m-%d", strict=False)
+    if dtype == pl.Utf8:
+        return raw
+    if dtype == pl.Categorical:
+        return raw.cast(pl.Categorical)
+    return raw.cast(dtype, strict=False)
+
+
+def apply_schema(frame, source, columns=None):
+    """
+    Converts the declared columns of `source` (or only `columns`) from raw strings
+    to their registry dtypes and flags rows where a non-empty value failed to
+    parse in the REJECTED column.
+    """
+    schema = SCHEMAS[source]
+    columns = columns or list(schema)
+    rejected = [
+        pl.col(c).is_not_null() & (pl.col(c).cast(pl.Utf8).str.strip_chars() != "") & _parse(c, schema[c]).is_null()
+        for c in columns
+    ]
+    return frame.with_columns([
+        *[_parse(c, schema[c]).alias(c) for c in columns],
+        pl.any_horizontal(rejected).alias(REJECTED),
+    ])
+
+
+def split_rejected(frame):
+    """Returns (accepted rows without the REJECTED column, number of rejected rows)."""
+    rejected = frame.select(pl.col(REJECTED).sum()).item()
+    return frame.filter(~pl.col(REJECTED)).drop(REJECTED), rejected
+
+
+def report_rejected(source, count):
+    if count:
+        print(f"⚠️ {source}: rejected {count:,} row(s) that did not match the declared schema")
+    else:
+        print(f"✅ {source}: all rows matched the declared schema")
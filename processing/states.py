@@ -0,0 +1,36 @@
+"""
+U.S. state names and their USPS abbreviations, shared by the processing
+stages and the analytics built on their outputs.
+"""
+
+import polars as pl
+
+# ACS place names carry a legal suffix ("Albany city"); housing names do not
+PLACE_SUFFIX = r"\s+(city|town|CDP|municipality|village|borough)$"
+
+STATE_MAP = {
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
+    "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE", "Florida": "FL", "Georgia": "GA",
+    "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA",
+    "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
+    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS", "Missouri": "MO",
+    "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH", "New Jersey": "NJ",
+    "New Mexico": "NM", "New York": "NY", "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH",
+    "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI",
+    "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX",
+    "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
+    "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY"
+}
+
+
+def align_acs_places(income):
+    """
+    Maps ACS City/State/Year to the housing convention: no place suffix, title
+    case, USPS state code and a YEAR column, so income joins housing on
+    (City, State, YEAR).
+    """
+    return income.with_columns([
+        pl.col("City").str.replace(PLACE_SUFFIX, "").str.strip_chars().str.to_titlecase(),
+        pl.col("State").replace_strict(STATE_MAP, default=pl.col("State")),
+        pl.col("Year").cast(pl.Int64).alias("YEAR"),
+    ])
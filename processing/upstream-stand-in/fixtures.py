@@ -0,0 +1,158 @@
+"""
+Deterministic synthetic bodies for every upstream endpoint, shaped like the
+real files closely enough for the processors, schemas and joins to run end to
+end. The same seed and sizes always produce byte-identical bodies (and so the
+same ETags).
+"""
+
+import numpy as np
+import polars as pl
+import gzip
+import io
+import json
+import re
+import sys
+import zipfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from states import STATE_MAP
+
+CITY_PREFIXES = ["Spring", "River", "Oak", "Maple", "Cedar", "Lake", "Fair", "Green", "Hill", "Pine"]
+CITY_SUFFIXES = ["field", "ton", "view", "dale", "wood", "port", "ville", "burg"]
+
+# Rough lat/lng box per state for ZIP centroids (continental U.S.)
+LAT_RANGE = (25.0, 49.0)
+LNG_RANGE = (-124.0, -67.0)
+
+
+class Fixtures:
+    def __init__(self, seed=0, n_zips=2000, first_year=2012, last_year=2024):
+        self.seed = seed
+        self.first_year = first_year
+        self.last_year = last_year
+        rng = np.random.default_rng(seed)
+
+        states = list(STATE_MAP.items())
+        names = [p + s for p in CITY_PREFIXES for s in CITY_SUFFIXES]
+        # Each city lives in one state; ZIPs are spread over the cities
+        cities = pl.DataFrame({
+            "city": names,
+            "state": rng.integers(0, len(states), len(names)),
+            "base_price": rng.lognormal(12.6, 0.45, len(names)),
+            "base_income": rng.normal(65_000, 15_000, len(names)).clip(25_000),
+        })
+        self.cities = cities.with_columns(
+            pl.col("state").map_elements(lambda i: states[i][0], return_dtype=pl.Utf8).alias("state_name"),
+            pl.col("state").map_elements(lambda i: states[i][1], return_dtype=pl.Utf8).alias("state_id"),
+        ).drop("state")
+
+        city = rng.integers(0, len(names), n_zips)
+        state_lat = rng.uniform(*LAT_RANGE, len(states))
+        state_lng = rng.uniform(*LNG_RANGE, len(states))
+        zips = np.sort(rng.choice(np.arange(1001, 99951), n_zips, replace=False))
+        self.zips = pl.DataFrame({"zip": zips, "city_idx": city}).join(
+            self.cities.with_row_index("city_idx").with_columns(pl.col("city_idx").cast(pl.Int64)),
+            on="city_idx",
+        ).drop("city_idx")
+        state_idx = np.array([list(STATE_MAP).index(s) for s in self.zips["state_name"]])
+        self.zips = self.zips.with_columns(
+            pl.Series("lat", state_lat[state_idx] + rng.normal(0, 1.0, n_zips)).round(5),
+            pl.Series("lng", state_lng[state_idx] + rng.normal(0, 1.0, n_zips)).round(5),
+            pl.Series("price_factor", rng.lognormal(0, 0.2, n_zips)),
+        ).sort("zip")
+
+        self.months = pl.date_range(
+            pl.date(first_year, 1, 1), pl.date(last_year, 12, 1), "1mo", eager=True
+        ).dt.month_end()
+        # 4% a year appreciation plus a shared wobble
+        t = np.arange(len(self.months)) / 12
+        self.market = 1.04 ** t * (1 + 0.03 * np.sin(t))
+
+    def _prices(self, noise_seed):
+        """ZIP × month price matrix."""
+        rng = np.random.default_rng([self.seed, noise_seed])
+        base = (self.zips["base_price"] * self.zips["price_factor"]).to_numpy()[:, None]
+        noise = rng.lognormal(0, 0.05, (len(self.zips), len(self.months)))
+        return np.round(base * self.market[None, :] * noise, -2)
+
+    # ------------------------------------------------------------------
+    # One body per upstream endpoint
+    # ------------------------------------------------------------------
+    def simplemaps_zip(self):
+        csv = self.zips.select([
+            pl.col("zip").cast(pl.Utf8).str.zfill(5),
+            "lat", "lng", "city", "state_id", "state_name",
+            (pl.col("city") + " County").alias("county_name"),
+        ]).write_csv()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("uszips.csv", csv)
+        return buffer.getvalue()
+
+    def redfin_tsv_gz(self):
+        prices = self._prices(1)
+        n_zips, n_months = prices.shape
+        period_end = self.months.to_numpy()
+        frame = pl.DataFrame({
+            "REGION": np.repeat("Zip Code: " + self.zips["zip"].cast(pl.Utf8).str.zfill(5).to_numpy().astype(object), n_months),
+            "REGION_TYPE": "zip code",
+            "STATE": np.repeat(self.zips["state_name"].to_numpy(), n_months),
+            "STATE_CODE": np.repeat(self.zips["state_id"].to_numpy(), n_months),
+            "PROPERTY_TYPE": "All Residential",
+            "PERIOD_END": np.tile(period_end, n_zips),
+            "MEDIAN_SALE_PRICE": prices.ravel(),
+        })
+        tsv = frame.write_csv(separator="\t", date_format="%Y-%m-%d")
+        # mtime=0 keeps the gzip header (and so the ETag) stable
+        return gzip.compress(tsv.encode("utf-8"), mtime=0)
+
+    def zillow_csv(self):
+        prices = self._prices(2)
+        columns = {str(m): prices[:, i] for i, m in enumerate(self.months.to_list())}
+        frame = pl.DataFrame({
+            "RegionID": np.arange(len(self.zips)) + 60000,
+            "SizeRank": np.arange(len(self.zips)),
+            "RegionName": self.zips["zip"],
+            "RegionType": "zip",
+            "StateName": self.zips["state_id"],
+            "State": self.zips["state_id"],
+            "City": self.zips["city"],
+            "CountyName": self.zips["city"] + " County",
+            **columns,
+        })
+        return frame.write_csv().encode("utf-8")
+
+    def acs_json(self, year):
+        rng = np.random.default_rng([self.seed, 3, year])
+        growth = 1.03 ** (year - self.first_year)
+        income = (self.cities["base_income"].to_numpy() * growth * rng.lognormal(0, 0.03, len(self.cities)))
+        rows = [["NAME", "S1901_C01_012E", "state", "place"]]
+        for i, (city, state, value) in enumerate(zip(self.cities["city"], self.cities["state_name"], income)):
+            rows.append([f"{city} city, {state}", str(int(value)), f"{i % 56:02d}", f"{i:05d}"])
+        return json.dumps(rows).encode("utf-8")
+
+    def fred_csv(self, series_id):
+        months = pl.date_range(pl.date(2000, 1, 1), pl.date(self.last_year, 12, 1), "1mo", eager=True)
+        t = np.arange(len(months)) / 12
+        # PCE deflator is 1.0 in 2017, rising 2% a year
+        deflator = 1.02 ** (t - 17)
+        real = 9_000 * 1.022 ** t
+        value = real * deflator if series_id == "PCE" else real
+        return pl.DataFrame({"observation_date": months, series_id: np.round(value, 1)}).write_csv().encode("utf-8")
+
+    def body(self, host, path, query):
+        """Synthetic body for an upstream URL, or None if no endpoint matches."""
+        if host == "redfin-public-data.s3.us-west-2.amazonaws.com" and path.endswith(".tsv000.gz"):
+            return self.redfin_tsv_gz()
+        if host == "simplemaps.com" and path.endswith(".zip"):
+            return self.simplemaps_zip()
+        if host == "files.zillowstatic.com" and path.endswith(".csv"):
+            return self.zillow_csv()
+        acs = re.fullmatch(r"/data/(\d{4})/acs/acs1/subject", path)
+        if host == "api.census.gov" and acs:
+            return self.acs_json(int(acs.group(1)))
+        series = re.search(r"(?:^|&)id=([A-Za-z0-9]+)", query)
+        if host == "fred.stlouisfed.org" and path == "/graph/fredgraph.csv" and series:
+            return self.fred_csv(series.group(1))
+        return None
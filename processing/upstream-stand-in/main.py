@@ -0,0 +1,247 @@
+"""
+Upstream Stand-in Server
+========================
+Serves every upstream the fetchers use (Redfin S3, SimpleMaps, Zillow, the
+Census API and FRED) from localhost, so downloads, retries, concurrency and
+caching can be exercised and benchmarked on an offline box. Requests are
+routed by the original host as the first path segment (see processing/upstream.py):
+
+    python main.py --port 8765 --latency-ms 200 --bandwidth-kbps 2048
+    HOUSING_UPSTREAM_BASE_URL=http://127.0.0.1:8765 python ../housing-data/main.py
+
+Bodies come from --fixtures-dir when a recorded file exists there
+(<dir>/<host>/<path>, with "__<query>" appended for URLs that have one),
+otherwise from the deterministic synthetic fixtures. Responses carry a
+content-hash ETag and honour If-None-Match, HEAD and single byte Range
+requests. Injected failures are decided per (URL, attempt number) from the
+seed, so a rerun sees exactly the same sequence of errors.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+import argparse
+import hashlib
+import re
+import threading
+import time
+import zlib
+from fixtures import Fixtures
+
+# The ACS 1-year release was not published for 2020; the real API answers 404
+DEFAULT_FAILURES = ["api.census.gov/data/2020/=404"]
+
+CONTENT_TYPES = {
+    ".gz": "application/gzip",
+    ".zip": "application/zip",
+    ".csv": "text/csv",
+}
+
+CHUNK_SIZE = 16 * 1024
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, args):
+        super().__init__(address, StandInHandler)
+        self.args = args
+        self.fixtures = Fixtures(args.seed, args.zips)
+        self.failures = [rule.rsplit("=", 1) for rule in args.fail]
+        self.last_modified = formatdate(0, usegmt=True)
+        self._bodies = {}
+        self._attempts = Counter()
+        self._lock = threading.Lock()
+
+    def attempt(self, url):
+        with self._lock:
+            self._attempts[url] += 1
+            return self._attempts[url]
+
+    def roll(self, kind, url, attempt):
+        """Deterministic uniform [0, 1) draw for one injected-failure decision."""
+        return zlib.crc32(f"{self.args.seed}:{kind}:{url}:{attempt}".encode("utf-8")) / 2 ** 32
+
+    def body(self, host, path, query):
+        """(body bytes, ETag) for an upstream URL, built once and kept in memory; None if unknown."""
+        key = (host, path, query)
+        with self._lock:
+            if key not in self._bodies:
+                body = self._recorded(host, path, query)
+                if body is None:
+                    body = self.fixtures.body(host, path, query)
+                etag = None if body is None else f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+                self._bodies[key] = (body, etag)
+            return self._bodies[key]
+
+    def _recorded(self, host, path, query):
+        if not self.args.fixtures_dir:
+            return None
+        name = path.lstrip("/") + (f"__{quote(query, safe='=')}" if query else "")
+        recorded = Path(self.args.fixtures_dir) / host / name
+        return recorded.read_bytes() if recorded.is_file() else None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def log_message(self, format, *args):
+        if not self.server.args.quiet:
+            super().log_message(format, *args)
+
+    def _error(self, status, message=""):
+        payload = message.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _serve(self, head):
+        server = self.server
+        args = server.args
+        url = self.path.lstrip("/")
+        parts = urlsplit(f"//{url}")
+        host, path, query = parts.netloc, parts.path or "/", parts.query
+        attempt = server.attempt(url)
+
+        if args.latency_ms:
+            time.sleep((args.latency_ms + server.roll("jitter", url, attempt) * args.jitter_ms) / 1000)
+
+        for pattern, status in server.failures:
+            if pattern in url:
+                return self._error(int(status), f"Injected {status} for {pattern}")
+        if server.roll("error", url, attempt) < args.error_rate:
+            return self._error(503, "Injected upstream error")
+
+        body, etag = server.body(host, path, query)
+        if body is None:
+            return self._error(404, f"No fixture for {host}{path}")
+
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start, end = 0, len(body) - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", etag) == etag:
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+            if not match or match.groups() == ("", ""):
+                return self._error(416, "Only a single byte range is supported")
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), end) if last else end
+            else:
+                start = max(len(body) - int(last), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", CONTENT_TYPES.get(Path(path).suffix, "application/json"))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.end_headers()
+        if head:
+            return
+
+        payload = memoryview(body)[start:end + 1]
+        if server.roll("truncate", url, attempt) < args.truncate_rate:
+            # Promise the full length, send half and hang up
+            payload = payload[:len(payload) // 2]
+            self.close_connection = True
+        self._send_throttled(payload, args.bandwidth_kbps)
+
+    def _send_throttled(self, payload, bandwidth_kbps):
+        """Writes `payload` in chunks, pacing them to the bandwidth cap (0 = unlimited)."""
+        started = time.monotonic()
+        sent = 0
+        for offset in range(0, len(payload), CHUNK_SIZE):
+            chunk = payload[offset:offset + CHUNK_SIZE]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+                return
+            sent += len(chunk)
+            if bandwidth_kbps:
+                ahead = sent / (bandwidth_kbps * 1024) - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for the upstream data sources.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures-dir", default=None,
+                        help="Recorded responses (<dir>/<host>/<path>) served instead of synthetic ones")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the synthetic fixtures and injected failures")
+    parser.add_argument("--zips", type=int, default=2000,
+                        help="Number of ZIP codes in the synthetic fixtures")
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="Delay before every response")
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="Extra random delay, up to this much, on top of --latency-ms")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0,
+                        help="Per-connection throughput cap in KiB/s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="Fraction of requests answered with 503")
+    parser.add_argument("--truncate-rate", type=float, default=0,
+                        help="Fraction of bodies cut off halfway through")
+    parser.add_argument("--fail", action="append", default=list(DEFAULT_FAILURES), metavar="SUBSTRING=STATUS",
+                        help="Answer URLs containing SUBSTRING with STATUS (repeatable; "
+                             f"default: {' '.join(DEFAULT_FAILURES)})")
+    parser.add_argument("--no-default-failures", action="store_true",
+                        help="Drop the default failure rules (e.g. serve ACS 2020)")
+    parser.add_argument("--quiet", action="store_true", help="Do not log every request")
+    args = parser.parse_args(argv)
+    if args.no_default_failures:
+        args.fail = [rule for rule in args.fail if rule not in DEFAULT_FAILURES]
+    return args
+
+
+def start(args):
+    """Starts the server on a background thread and returns it (call .shutdown() to stop)."""
+    server = StandInServer((args.host, args.port), args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    args = parse_args()
+    server = StandInServer((args.host, args.port), args)
+    host, port = server.server_address[:2]
+    print(f"🛰️ Upstream stand-in listening on http://{host}:{port}")
+    print(f"   export HOUSING_UPSTREAM_BASE_URL=http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Upstream URLs
+=============
+Every fetcher resolves its public source URL through `upstream_url`, so the
+whole pipeline can be pointed at another host (e.g. the local stand-in server
+in processing/upstream-stand-in) by setting HOUSING_UPSTREAM_BASE_URL. The
+original host becomes the first path segment:
+
+    https://api.census.gov/data/2019/acs/acs1/subject
+    → http://127.0.0.1:8765/api.census.gov/data/2019/acs/acs1/subject
+"""
+
+from urllib.parse import urlsplit
+import os
+
+UPSTREAM_ENV = "HOUSING_UPSTREAM_BASE_URL"
+
+# Some hosts refuse urllib's default agent
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/119.0.0.0 Safari/537.36"
+)
+
+# SimpleMaps ZIP database: the Redfin ZIP → city crosswalk and the place list every sample is drawn from
+SIMPLEMAPS_URL = "https://simplemaps.com/static/data/us-zips/1.911/basic/simplemaps_uszips_basicv1.911.zip"
+
+
+def upstream_url(url, base_url=None):
+    """`url` rewritten onto `base_url` (default: $HOUSING_UPSTREAM_BASE_URL), or unchanged if unset."""
+    base_url = base_url or os.environ.get(UPSTREAM_ENV)
+    if not base_url:
+        return url
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{base_url.rstrip('/')}/{parts.netloc}{parts.path}{query}"
@@ -9,9 +9,80 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+import argparse
 import os
+import sys
 from pathlib import Path
 
+# Datasets are handed over from the processing stages as Arrow, not re-parsed CSV
+sys.path.append(str(Path(__file__).resolve().parent.parent / "processing"))
+from handoff import load_pandas, published_at
+import metrics
+from panel import HousingPanel
+from sampling import sample_fraction, sampled_name, sampled_path, sample_label
+
+# Above this many points, scatter-style charts are pre-binned before plotting
+BINNED_ROW_THRESHOLD = 50_000
+BINNED_GRID_SIZE = 200
+
+parser = argparse.ArgumentParser(description="Generate charts from the processed datasets.")
+parser.add_argument(
+    "--render-mode",
+    choices=["auto", "scatter", "binned"],
+    default="auto",
+    help="'binned' pre-aggregates points into a 2D grid; 'auto' switches to it "
+         f"above {BINNED_ROW_THRESHOLD:,} points",
+)
+parser.add_argument(
+    "--sample",
+    type=sample_fraction,
+    default=None,
+    metavar="FRACTION",
+    help="Chart the outputs of a sampled preview run (same fraction as the processing stages)",
+)
+args = parser.parse_args()
+
+
+def use_binned_mode(n_points):
+    """Decide whether a chart with n_points should be rendered binned."""
+    if args.render_mode == "auto":
+        return n_points > BINNED_ROW_THRESHOLD
+    return args.render_mode == "binned"
+
+
+def bin_points(x, y, c, bins=BINNED_GRID_SIZE):
+    """
+    Bin points into a bins x bins grid with vectorized 2D histograms.
+    Returns the bin edges, the point count per cell and the mean of c per cell
+    (NaN where a cell is empty), so the plot cost no longer depends on row count.
+    """
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    c_sums, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges], weights=c)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        c_means = np.where(counts > 0, c_sums / counts, np.nan)
+    return x_edges, y_edges, counts, c_means
+
+
+def linear_fit(x, y):
+    """Least-squares slope, intercept and Pearson correlation in one NumPy pass."""
+    x_centered = x - x.mean()
+    y_centered = y - y.mean()
+    sxx = np.dot(x_centered, x_centered)
+    syy = np.dot(y_centered, y_centered)
+    sxy = np.dot(x_centered, y_centered)
+    slope = sxy / sxx
+    intercept = y.mean() - slope * x.mean()
+    corr = sxy / np.sqrt(sxx * syy)
+    return slope, intercept, corr
+
+
+def place_labels(df, with_year=False):
+    """Build 'City, State' (optionally '(YEAR)') tick labels without iterating rows."""
+    labels = df['City'].astype(str) + ", " + df['State'].astype(str)
+    if with_year:
+        labels = labels + " (" + df['YEAR'].astype(str) + ")"
+    return labels.tolist()
+
 # Set style for better-looking plots
 sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (12, 6)
@@ -19,14 +90,71 @@ plt.rcParams['font.size'] = 10
 
 # Create output directory for visualizations
 OUTPUT_DIR = Path("../processed-data/visualizations")
+if args.sample:
+    # Previews never overwrite the published charts
+    OUTPUT_DIR = OUTPUT_DIR / sample_label(args.sample)
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 print("📊 Loading datasets...")
 
+def load_dataset(name, csv_path, sample=None):
+    """Loads a published Arrow dataset zero-copy, falling back to its CSV export."""
+    name, csv_path = sampled_name(name, sample), sampled_path(csv_path, sample)
+    try:
+        return load_pandas(name)
+    except FileNotFoundError:
+        print(f"⚠️  No Arrow handoff for {name}; reading {csv_path}")
+        return pd.read_csv(csv_path, engine="pyarrow", dtype_backend="pyarrow")
+
+
+def save_chart(path, **kwargs):
+    """Saves the current figure, stamping sampled previews so they are never mistaken for full results."""
+    if args.sample:
+        plt.gcf().text(0.99, 0.01, f"PREVIEW: {args.sample * 100:g}% of places",
+                       ha='right', va='bottom', fontsize=10, fontweight='bold', color='red')
+    plt.savefig(path, **kwargs)
+
+
 # Load datasets
-housing_df = pd.read_csv("../processed-data/housing-data/housing_prices_city_aggregated.csv")
-income_df = pd.read_csv("../processed-data/median-salary/acs1y_s1901_median_income_2010_2023.csv")
-spending_df = pd.read_csv("../processed-data/cost-of-living/us_consumer_spending.csv")
+housing_df = load_dataset("housing_prices_city_aggregated",
+                          "../processed-data/housing-data/housing_prices_city_aggregated.csv", args.sample)
+income_df = load_dataset("acs1y_s1901_median_income",
+                         "../processed-data/median-salary/acs1y_s1901_median_income_2010_2023.csv", args.sample)
+spending_df = load_dataset("us_consumer_spending",
+                           "../processed-data/cost-of-living/us_consumer_spending.csv")
+
+
+def load_metrics(name, inputs, compute):
+    """
+    Loads a table from the derived-metrics stage, computing it in-process if it
+    was not run or was run before any of its (published) `inputs` changed.
+    """
+    name = sampled_name(name, args.sample)
+    built = published_at(name)
+    if built is None:
+        print(f"⚠️  No Arrow handoff for {name}; computing it in-process")
+        return compute().to_pandas(use_pyarrow_extension_array=True)
+    newer = [i for i in inputs if (published_at(i) or 0) > built]
+    if newer:
+        print(f"⚠️  {name} is older than {', '.join(newer)}; recomputing it in-process "
+              f"(re-run processing/derived-metrics to refresh it)")
+        return compute().to_pandas(use_pyarrow_extension_array=True)
+    return load_pandas(name)
+
+
+# Growth, ratio and rank columns precomputed by processing/derived-metrics
+housing_name = sampled_name("housing_prices_city_aggregated", args.sample)
+income_name = sampled_name("acs1y_s1901_median_income", args.sample)
+spending_name = "us_consumer_spending"
+spending_metrics_df = load_metrics("us_consumer_spending_metrics", [spending_name],
+                                   lambda: metrics.spending_metrics(spending_df))
+state_income_df = load_metrics("median_income_metrics_state_year", [income_name, spending_name],
+                               lambda: metrics.state_income_metrics(income_df, spending_df))
+housing_metrics_df = load_metrics("housing_metrics_city_year", [housing_name, income_name, spending_name],
+                                  lambda: metrics.housing_metrics(housing_df, income_df, spending_df))
+
+# Dense place × year matrices for the ranking charts (cells are looked up, not filtered)
+panel = HousingPanel.from_frames(housing_df, income_df, spending_df)
 
 print(f"✅ Housing data: {len(housing_df):,} records")
 print(f"✅ Income data: {len(income_df):,} records")
@@ -40,7 +168,7 @@ print("\n📈 Creating consumer spending visualization...")
 fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
 
 # Plot 1: Real vs Nominal Consumer Spending
-spending_clean = spending_df.dropna()
+spending_clean = spending_metrics_df.dropna(subset=['nominal_consumer_spending', 'real_consumer_spending'])
 ax1.plot(spending_clean['year'], spending_clean['nominal_consumer_spending'], 
          label='Nominal Spending', linewidth=2, marker='o', markersize=4)
 ax1.plot(spending_clean['year'], spending_clean['real_consumer_spending'], 
@@ -52,9 +180,6 @@ ax1.legend(fontsize=11)
 ax1.grid(True, alpha=0.3)
 
 # Plot 2: Inflation Impact (Nominal/Real ratio)
-spending_clean = spending_clean.copy()
-spending_clean['inflation_factor'] = (spending_clean['nominal_consumer_spending'] / 
-                                       spending_clean['real_consumer_spending'])
 ax2.plot(spending_clean['year'], spending_clean['inflation_factor'], 
          linewidth=2, marker='o', markersize=4, color='coral')
 ax2.set_xlabel('Year', fontsize=12, fontweight='bold')
@@ -65,7 +190,7 @@ ax2.axhline(y=1.0, color='red', linestyle='--', alpha=0.5, label='Baseline (2017
 ax2.legend(fontsize=11)
 
 plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "01_consumer_spending_trends.png", dpi=300, bbox_inches='tight')
+save_chart(OUTPUT_DIR / "01_consumer_spending_trends.png", dpi=300, bbox_inches='tight')
 print(f"✅ Saved: {OUTPUT_DIR / '01_consumer_spending_trends.png'}")
 plt.close()
 
@@ -100,7 +225,7 @@ ax2.set_title('Data Coverage: Cities with Housing Data by Year', fontsize=14, fo
 ax2.grid(True, alpha=0.3, axis='y')
 
 plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "02_housing_price_trends.png", dpi=300, bbox_inches='tight')
+save_chart(OUTPUT_DIR / "02_housing_price_trends.png", dpi=300, bbox_inches='tight')
 print(f"✅ Saved: {OUTPUT_DIR / '02_housing_price_trends.png'}")
 plt.close()
 
@@ -110,31 +235,28 @@ plt.close()
 print("\n💰 Creating most expensive cities visualization...")
 
 # Get 2024 data (or most recent year)
-recent_year = housing_df['YEAR'].max()
-recent_housing = housing_df[housing_df['YEAR'] == recent_year].copy()
-
-# Filter for cities with reasonable data (at least 10 zip codes)
-recent_housing_filtered = recent_housing[recent_housing['zip_count'] >= 10]
+recent_year = int(housing_df['YEAR'].max())
 
-# Get top 10 most expensive
-top_10_expensive = recent_housing_filtered.nlargest(10, 'avg_price')
+# Top 10 most expensive among cities with reasonable data (at least 10 zip codes)
+top_10_expensive = panel.top_cells(
+    'avg_price', 10, where=(panel['zip_count'] >= 10) & (panel.years == recent_year)
+).to_pandas()
 
 fig, ax = plt.subplots(figsize=(12, 8))
 bars = ax.barh(range(len(top_10_expensive)), top_10_expensive['avg_price'], color='darkgreen', alpha=0.7)
 ax.set_yticks(range(len(top_10_expensive)))
-ax.set_yticklabels([f"{row['City']}, {row['State']}" for _, row in top_10_expensive.iterrows()])
+ax.set_yticklabels(place_labels(top_10_expensive))
 ax.set_xlabel('Average Price ($)', fontsize=12, fontweight='bold')
 ax.set_title(f'Top 10 Most Expensive Cities ({recent_year})', fontsize=14, fontweight='bold')
 ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x/1000:.0f}K'))
 ax.grid(True, alpha=0.3, axis='x')
 
 # Add value labels on bars
-for i, (idx, row) in enumerate(top_10_expensive.iterrows()):
-    ax.text(row['avg_price'], i, f" ${row['avg_price']/1000:.0f}K", 
-            va='center', fontsize=9, fontweight='bold')
+ax.bar_label(bars, labels=[f" ${v:.0f}K" for v in top_10_expensive['avg_price'].to_numpy() / 1000],
+             fontsize=9, fontweight='bold')
 
 plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "03_top_10_expensive_cities.png", dpi=300, bbox_inches='tight')
+save_chart(OUTPUT_DIR / "03_top_10_expensive_cities.png", dpi=300, bbox_inches='tight')
 print(f"✅ Saved: {OUTPUT_DIR / '03_top_10_expensive_cities.png'}")
 plt.close()
 
@@ -143,21 +265,18 @@ plt.close()
 # ============================================================================
 print("\n💵 Creating median income trends visualization...")
 
-# Calculate average income by state and year
-income_state_year = income_df.groupby(['State', 'Year'])['Median_Income'].mean().reset_index()
+# Average income by state and year, one column per state
+income_state_year = state_income_df.pivot(index='YEAR', columns='State', values='Median_Income')
 
 # Get top 10 states by most recent average income
-recent_income_year = income_df['Year'].max()
-top_states = (income_df[income_df['Year'] == recent_income_year]
-              .groupby('State')['Median_Income'].mean()
-              .nlargest(10).index.tolist())
+top_states = income_state_year.iloc[-1].nlargest(10).index.tolist()
 
 fig, ax = plt.subplots(figsize=(14, 8))
 
-for state in top_states:
-    state_data = income_state_year[income_state_year['State'] == state]
-    ax.plot(state_data['Year'], state_data['Median_Income'], 
-            marker='o', linewidth=2, label=state, markersize=5)
+lines = ax.plot(income_state_year.index, income_state_year[top_states].to_numpy(dtype=np.float64),
+                marker='o', linewidth=2, markersize=5)
+for line, state in zip(lines, top_states):
+    line.set_label(state)
 
 ax.set_xlabel('Year', fontsize=12, fontweight='bold')
 ax.set_ylabel('Median Household Income ($)', fontsize=12, fontweight='bold')
@@ -167,7 +286,7 @@ ax.grid(True, alpha=0.3)
 ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x/1000:.0f}K'))
 
 plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "04_income_trends_top_states.png", dpi=300, bbox_inches='tight')
+save_chart(OUTPUT_DIR / "04_income_trends_top_states.png", dpi=300, bbox_inches='tight')
 print(f"✅ Saved: {OUTPUT_DIR / '04_income_trends_top_states.png'}")
 plt.close()
 
@@ -176,32 +295,17 @@ plt.close()
 # ============================================================================
 print("\n🏘️  Creating housing affordability analysis...")
 
-# Clean city names in income data (remove "city", "town", etc.)
-income_df['City_Clean'] = income_df['City'].str.replace(r'\s+(city|town|CDP|municipality)$', '', regex=True)
+# Price-to-income ratio for every place-year cell (NaN where ACS does not cover the place)
+panel.add('price_to_income_ratio', panel.ratio('avg_price', 'median_income'))
 
-# Merge housing and income data
-merged_df = pd.merge(
-    housing_df,
-    income_df,
-    left_on=['City', 'State', 'YEAR'],
-    right_on=['City_Clean', 'State', 'Year'],
-    how='inner'
-)
-
-# Calculate price-to-income ratio
-merged_df['price_to_income_ratio'] = merged_df['avg_price'] / merged_df['Median_Income']
-
-# Get recent data for analysis
-recent_merged = merged_df[merged_df['YEAR'] >= 2020].copy()
-
-# Get cities with highest and lowest affordability (filter for data quality)
-recent_merged_filtered = recent_merged[recent_merged['zip_count'] >= 5]
+# Recent years only, for cities with reasonable data (at least 5 zip codes)
+recent_reliable = (panel['zip_count'] >= 5) & (panel.years >= 2020)
 
-# Top 10 least affordable (highest ratio)
-least_affordable = recent_merged_filtered.nlargest(15, 'price_to_income_ratio')
+# Top 15 least affordable (highest ratio)
+least_affordable = panel.top_cells('price_to_income_ratio', 15, where=recent_reliable).to_pandas()
 
-# Top 10 most affordable (lowest ratio)
-most_affordable = recent_merged_filtered.nsmallest(15, 'price_to_income_ratio')
+# Top 15 most affordable (lowest ratio)
+most_affordable = panel.top_cells('price_to_income_ratio', 15, ascending=True, where=recent_reliable).to_pandas()
 
 fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 8))
 
@@ -209,8 +313,7 @@ fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 8))
 bars1 = ax1.barh(range(len(least_affordable)), least_affordable['price_to_income_ratio'], 
                  color='darkred', alpha=0.7)
 ax1.set_yticks(range(len(least_affordable)))
-ax1.set_yticklabels([f"{row['City']}, {row['State']} ({row['YEAR']})" 
-                      for _, row in least_affordable.iterrows()], fontsize=9)
+ax1.set_yticklabels(place_labels(least_affordable, with_year=True), fontsize=9)
 ax1.set_xlabel('Price-to-Income Ratio', fontsize=11, fontweight='bold')
 ax1.set_title('Least Affordable Cities (2020+)', fontsize=13, fontweight='bold')
 ax1.grid(True, alpha=0.3, axis='x')
@@ -219,14 +322,13 @@ ax1.grid(True, alpha=0.3, axis='x')
 bars2 = ax2.barh(range(len(most_affordable)), most_affordable['price_to_income_ratio'], 
                  color='darkgreen', alpha=0.7)
 ax2.set_yticks(range(len(most_affordable)))
-ax2.set_yticklabels([f"{row['City']}, {row['State']} ({row['YEAR']})" 
-                      for _, row in most_affordable.iterrows()], fontsize=9)
+ax2.set_yticklabels(place_labels(most_affordable, with_year=True), fontsize=9)
 ax2.set_xlabel('Price-to-Income Ratio', fontsize=11, fontweight='bold')
 ax2.set_title('Most Affordable Cities (2020+)', fontsize=13, fontweight='bold')
 ax2.grid(True, alpha=0.3, axis='x')
 
 plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "05_housing_affordability.png", dpi=300, bbox_inches='tight')
+save_chart(OUTPUT_DIR / "05_housing_affordability.png", dpi=300, bbox_inches='tight')
 print(f"✅ Saved: {OUTPUT_DIR / '05_housing_affordability.png'}")
 plt.close()
 
@@ -235,6 +337,9 @@ plt.close()
 # ============================================================================
 print("\n📊 Creating correlation analysis...")
 
+# City-years where ACS income covers the housing place (ratio precomputed by derived-metrics)
+merged_df = housing_metrics_df.dropna(subset=['price_to_income_ratio'])
+
 # Use recent data for correlation
 correlation_data = merged_df[merged_df['YEAR'] >= 2015].copy()
 
@@ -243,21 +348,37 @@ correlation_data = correlation_data.dropna(subset=['Median_Income', 'avg_price']
 
 if len(correlation_data) > 0:
     fig, ax = plt.subplots(figsize=(12, 8))
-    
-    # Create scatter plot
-    scatter = ax.scatter(correlation_data['Median_Income'], 
-                         correlation_data['avg_price'],
-                         c=correlation_data['YEAR'], 
-                         cmap='viridis',
-                         alpha=0.5, 
-                         s=30)
-    
-    # Add trend line
-    z = np.polyfit(correlation_data['Median_Income'], correlation_data['avg_price'], 1)
-    p = np.poly1d(z)
-    ax.plot(correlation_data['Median_Income'].sort_values(), 
-            p(correlation_data['Median_Income'].sort_values()), 
-            "r--", linewidth=2, label=f'Trend line: y={z[0]:.2f}x+{z[1]:.0f}')
+
+    income = correlation_data['Median_Income'].to_numpy(dtype=np.float64)
+    price = correlation_data['avg_price'].to_numpy(dtype=np.float64)
+    year = correlation_data['YEAR'].to_numpy(dtype=np.float64)
+
+    if use_binned_mode(len(correlation_data)):
+        # Pre-bin points so render time and PNG size stay flat as rows grow
+        print(f"   Binned mode: {len(correlation_data):,} points → {BINNED_GRID_SIZE}x{BINNED_GRID_SIZE} grid")
+        x_edges, y_edges, counts, year_means = bin_points(income, price, year)
+        # Colour shows the mean year; opacity shows density (log of the point count per cell)
+        density = np.log1p(counts.T) / np.log1p(counts.max())
+        scatter = ax.pcolormesh(x_edges, y_edges, np.ma.masked_invalid(year_means.T),
+                                cmap='viridis', alpha=np.where(counts.T > 0, 0.15 + 0.85 * density, 0),
+                                shading='flat')
+        ax.text(0.95, 0.05, f'Opacity: points per cell (log, max {counts.max():,.0f})',
+                transform=ax.transAxes, fontsize=10, ha='right', va='bottom',
+                bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+    else:
+        # Create scatter plot
+        scatter = ax.scatter(income,
+                             price,
+                             c=year,
+                             cmap='viridis',
+                             alpha=0.5,
+                             s=30)
+
+    # Add trend line (a straight line only needs its two endpoints)
+    slope, intercept, corr = linear_fit(income, price)
+    line_x = np.array([income.min(), income.max()])
+    ax.plot(line_x, slope * line_x + intercept,
+            "r--", linewidth=2, label=f'Trend line: y={slope:.2f}x+{intercept:.0f}')
     
     ax.set_xlabel('Median Household Income ($)', fontsize=12, fontweight='bold')
     ax.set_ylabel('Average Housing Price ($)', fontsize=12, fontweight='bold')
@@ -271,14 +392,13 @@ if len(correlation_data) > 0:
     cbar = plt.colorbar(scatter, ax=ax)
     cbar.set_label('Year', fontsize=11, fontweight='bold')
     
-    # Calculate and display correlation coefficient
-    corr = correlation_data[['Median_Income', 'avg_price']].corr().iloc[0, 1]
+    # Display correlation coefficient
     ax.text(0.05, 0.95, f'Correlation: {corr:.3f}', 
             transform=ax.transAxes, fontsize=12, fontweight='bold',
             verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
     
     plt.tight_layout()
-    plt.savefig(OUTPUT_DIR / "06_price_income_correlation.png", dpi=300, bbox_inches='tight')
+    save_chart(OUTPUT_DIR / "06_price_income_correlation.png", dpi=300, bbox_inches='tight')
     print(f"✅ Saved: {OUTPUT_DIR / '06_price_income_correlation.png'}")
     plt.close()
 else:
@@ -318,6 +438,8 @@ summary_stats = {
 with open(OUTPUT_DIR / "00_summary_statistics.txt", 'w') as f:
     f.write("=" * 70 + "\n")
     f.write("DATA SUMMARY STATISTICS\n")
+    if args.sample:
+        f.write(f"PREVIEW: deterministic {args.sample * 100:g}% sample of places, not the full dataset\n")
     f.write("=" * 70 + "\n\n")
     
     for dataset_name, stats in summary_stats.items():